@@ -0,0 +1,430 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from ClockifyAPI import CLOCKIFY_RATE_LIMIT, RetVal, addToEntryIndex, discardFromEntryIndex, entryMatches, indexBy
+from Metrics import getMetrics
+from RateLimiter import getRateLimiter, retryAfterSeconds
+from TimeConversion import clockifyTime, shiftClockifyTime, toEpoch
+from TimeEntry import TimeEntry, internTags
+
+
+def _bodySize(body):
+    return len(json.dumps(body)) if body != None else 0
+
+
+class AsyncResponse:
+    """Body of an aiohttp response read while the connection was held, mimics requests.Response."""
+
+    def __init__(self, status_code, reason, text):
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+        self.ok = status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncClockifyAPI:
+    """Coroutine version of ClockifyAPI for a single API token.
+
+    At most `concurrency` requests are in flight at once over one pooled aiohttp session. The
+    requests are paced by the same per-token RateLimiter as the blocking ClockifyAPI, so both
+    clients can be used side by side without exceeding the API limits.
+
+        async with AsyncClockifyAPI(token, adminEmail) as clockify:
+            results = await asyncio.gather(*[clockify.addEntry(...) for row in rows])
+    """
+
+    def __init__(self, apiToken, adminEmail, concurrency=10, rateLimit=CLOCKIFY_RATE_LIMIT,
+                 maxRetries=5, pageSize=200, pageWorkers=4, taskCacheSize=100, session=None,
+                 url='https://api.clockify.me/api/v1'):
+        self.logger = logging.getLogger('clockify-automation')
+        self.url = url
+        self.apiToken = apiToken
+        self._adminEmail = adminEmail
+        self._concurrency = concurrency
+        self._rateLimit = rateLimit
+        self._maxRetries = maxRetries
+        self._pageSize = pageSize
+        self._pageWorkers = pageWorkers
+        self._session = session
+        self._ownsSession = session == None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._metaLock = asyncio.Lock()
+        self._syncClients = True
+        self._syncUsers = True
+        self._syncProjects = True
+        self._syncTags = True
+        self._entryIndex = {}
+        # tasks per project ID, least recently used first
+        self._taskCacheSize = taskCacheSize
+        self._tasks = OrderedDict()
+        self.email = None
+        self.userID = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, excType, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self._session == None:
+            connector = aiohttp.TCPConnector(limit=self._concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, headers={
+                "X-Api-Key": self.apiToken,
+                "Content-Type": "application/json"})
+
+        self.logger.info("testing clockify APIKey %s" % self.apiToken)
+        rv = await self._request(self.url + "/user")
+        if rv.status_code != 200:
+            raise RuntimeError("error loading user (API token %s), status code %s" % (self.apiToken, str(rv.status_code)))
+        user = rv.json()
+        if (user["status"].upper() != "ACTIVE") and (user["status"].upper() != "PENDING_EMAIL_VERIFICATION"):
+            raise RuntimeError(
+                "user '%s' is not an active user in clockify. Please activate the user for the migration process" %
+                user["email"])
+        if user["email"].lower() != self._adminEmail.lower():
+            raise RuntimeError("admin mail address was given as %s but not found in clockify API tokens" % self._adminEmail)
+        self.email = user["email"]
+        self.userID = user["id"]
+        self.logger.info("...ok, key resolved to email %s" % self.email)
+
+        await self._getWorkspaces()
+        return self
+
+    async def close(self):
+        if self._ownsSession and self._session != None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, url, body=None, typ="GET"):
+        if typ == "GET":
+            return await self._send("GET", url, params=body)
+        elif typ in ("POST", "PUT"):
+            return await self._send(typ, url, json=body)
+        elif typ == "DELETE":
+            return await self._send("DELETE", url, params=body)
+        raise RuntimeError("invalid request type %s" % typ)
+
+    async def _send(self, method, url, params=None, json=None):
+        limiter = getRateLimiter("clockify:%s" % self.apiToken, self._rateLimit)
+        metrics = getMetrics()
+        bodySize = _bodySize(json)
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                wait = limiter.reserve()
+                if wait > 0:
+                    metrics.recordSleep("clockify", wait)
+                    await asyncio.sleep(wait)
+                started = time.perf_counter()
+                async with self._session.request(method, url, params=params, json=json) as response:
+                    rv = AsyncResponse(response.status, response.reason, await response.text())
+                    retryAfter = retryAfterSeconds(response.headers)
+                metrics.record("clockify", method, url, rv.status_code, time.perf_counter() - started,
+                               bodySize, len(rv.text))
+                if rv.status_code != 429:
+                    limiter.success()
+                    return rv
+                if attempt >= self._maxRetries:
+                    self.logger.warning("giving up on %s %s after %d rate limited attempts" % (method, url, attempt + 1))
+                    return rv
+                delay = limiter.backoff(retryAfter)
+                self.logger.warning("rate limited on %s %s, retrying in %.2fs" % (method, url, delay))
+                attempt += 1
+
+    async def multiGetRequest(self, url, idKey="id", params=None):
+        return [d async for d in self.multiGetIter(url, idKey, params)]
+
+    async def multiGetIter(self, url, idKey="id", params=None):
+        """Yields the records of a paginated endpoint, see ClockifyAPI.multiGetIter."""
+        pageSize = self._pageSize
+
+        async def fetch(page):
+            body = dict(params) if params != None else {}
+            body["page"] = page
+            body["page-size"] = pageSize
+            return await self._send("GET", url, params=body)
+
+        while True:
+            pages = [await fetch(1)]
+            if pages[0].status_code == 400 and pageSize > 50:
+                pageSize = max(50, pageSize // 2)
+                continue
+            break
+
+        seen = set()
+        nextPage = 2
+        while True:
+            for rv in pages:
+                if rv.status_code != 200:
+                    raise RuntimeError("get on url %s failed with status code %d" % (url, rv.status_code))
+                data = rv.json()
+                if len(data) > 0 and data[0][idKey] in seen:
+                    return
+                for d in data:
+                    if d[idKey] not in seen:
+                        seen.add(d[idKey])
+                        yield d
+                if len(data) < pageSize:
+                    return
+            pages = await asyncio.gather(*[fetch(p) for p in range(nextPage, nextPage + self._pageWorkers)])
+            nextPage += self._pageWorkers
+
+    async def _getWorkspaces(self):
+        rv = await self._request(self.url + "/workspaces")
+        if rv.status_code != 200:
+            raise RuntimeError("Querying workspaces for user %s failed, status code=%d, msg=%s" % (
+                self.email, rv.status_code, rv.text))
+        self.workspaces = rv.json()
+        self._workspaceIds = indexBy(self.workspaces, "name")
+        return self.workspaces
+
+    def getWorkspaces(self):
+        return self.workspaces
+
+    def getWorkspaceID(self, workspaceName):
+        wsId = self._workspaceIds.get(workspaceName)
+        if wsId == None:
+            raise RuntimeError("Workspace %s not found. Available workspaces: %s" % (workspaceName, self.workspaces))
+        return wsId
+
+    async def getProjects(self, workspace):
+        async with self._metaLock:
+            if self._syncProjects == True:
+                url = self.url + "/workspaces/%s/projects" % self.getWorkspaceID(workspace)
+                self.projects = await self.multiGetRequest(url)
+                self._projectIds = indexBy(self.projects, "name")
+                self._syncProjects = False
+        return self.projects
+
+    async def getProjectID(self, project, workspace):
+        await self.getProjects(workspace)
+        pId = self._projectIds.get(project)
+        if pId == None:
+            raise RuntimeError("Project %s not found in workspace %s" % (project, workspace))
+        return pId
+
+    async def getClients(self, workspace):
+        async with self._metaLock:
+            if self._syncClients == True:
+                url = self.url + "/workspaces/%s/clients" % self.getWorkspaceID(workspace)
+                self.clients = await self.multiGetRequest(url)
+                self._clientIds = indexBy(self.clients, "name")
+                self._syncClients = False
+        return self.clients
+
+    async def getClientID(self, client, workspace):
+        await self.getClients(workspace)
+        clId = self._clientIds.get(client)
+        if clId == None:
+            raise RuntimeError("Client %s not found in workspace %s" % (client, workspace))
+        return clId
+
+    async def _projectTasks(self, wsId, projectId, refresh=False):
+        """See ClockifyAPI._projectTasks."""
+        async with self._metaLock:
+            tasks = None if refresh else self._tasks.get(projectId)
+            if tasks != None:
+                self._tasks.move_to_end(projectId)
+                return tasks, True
+
+            url = self.url + "/workspaces/%s/projects/%s/tasks" % (wsId, projectId)
+            pTasks = await self.multiGetRequest(url)
+            tasks = (pTasks, indexBy(pTasks, "name"))
+            self._tasks[projectId] = tasks
+            self._tasks.move_to_end(projectId)
+            while len(self._tasks) > self._taskCacheSize:
+                self._tasks.popitem(last=False)
+        return tasks, False
+
+    async def getTaskID(self, taskName, projectId, workspace):
+        wsId = self.getWorkspaceID(workspace)
+        (_, taskIds), cached = await self._projectTasks(wsId, projectId)
+        tId = taskIds.get(taskName)
+        if tId == None and cached:
+            # the task may have been created since the project tasks were cached
+            (_, taskIds), _ = await self._projectTasks(wsId, projectId, refresh=True)
+            tId = taskIds.get(taskName)
+        if tId == None:
+            raise RuntimeError("Task %s not found." % (taskName))
+        return tId
+
+    async def getUsers(self, workspace):
+        async with self._metaLock:
+            if self._syncUsers == True:
+                rv = await self._request(self.url + "/workspace/%s/users" % self.getWorkspaceID(workspace))
+                self.users = rv.json()
+                self._userIdsByName = indexBy(self.users, "name")
+                self._userIdsByMail = indexBy(self.users, "email", lower=True)
+                self._userMailsById = indexBy(self.users, "id", "email")
+                self._syncUsers = False
+        return self.users
+
+    async def getUserIDByMail(self, email, workspace):
+        await self.getUsers(workspace)
+        uId = self._userIdsByMail.get(email.lower())
+        if uId == None:
+            raise RuntimeError("User %s not found in workspace %s" % (email, workspace))
+        return uId
+
+    async def getTags(self, workspace):
+        async with self._metaLock:
+            if self._syncTags == True:
+                url = self.url + "/workspaces/%s/tags" % self.getWorkspaceID(workspace)
+                self.tags = await self.multiGetRequest(url)
+                self._tagIdsByName = indexBy(self.tags, "name")
+                self._tagNamesById = indexBy(self.tags, "id", "name")
+                self._syncTags = False
+        return self.tags
+
+    async def getTagID(self, tagName, workspace):
+        await self.getTags(workspace)
+        tId = self._tagIdsByName.get(tagName)
+        if tId == None:
+            raise RuntimeError("Tag %s not found in workspace %s" % (tagName, workspace))
+        return tId
+
+    async def getTagName(self, tagID, workspace):
+        await self.getTags(workspace)
+        return self._tagName(tagID, workspace)
+
+    def _tagName(self, tagID, workspace):
+        tName = self._tagNamesById.get(tagID)
+        if tName == None:
+            raise RuntimeError("TagID %s not found in workspace %s" % (tagID, workspace))
+        return tName
+
+    def _checkUser(self, userMail):
+        if userMail.lower() != self.email.lower():
+            self.logger.warning("user %s not found" % userMail)
+            return RetVal.ERR
+        return RetVal.OK
+
+    async def prefetchTimeEntries(self, userMail, workspace, start, end):
+        """See ClockifyAPI.prefetchTimeEntries."""
+        rv = self._checkUser(userMail)
+        if rv != RetVal.OK:
+            return rv
+
+        url = self.url + "/workspaces/%s/user/%s/time-entries" % (self.getWorkspaceID(workspace), self.userID)
+        window = (toEpoch(start), toEpoch(end))
+        start = clockifyTime(start)
+        end = clockifyTime(end)
+        index = {}
+        async for d in self.multiGetIter(url, params={"start": start, "end": end}):
+            addToEntryIndex(index, TimeEntry.fromClockify(d))
+        self._entryIndex[self.userID] = window + (index,)
+        return RetVal.OK
+
+    def _prefetchedEntries(self, start):
+        window = self._entryIndex.get(self.userID)
+        if window == None:
+            return None
+        winStart, winEnd, index = window
+        if start < winStart or start >= winEnd:
+            return None
+        return index
+
+    async def getTimeEntryForUser(self, userMail, workspace, description, projectName, start, timeZone="Z", end=None):
+        data = None
+        rv = self._checkUser(userMail)
+
+        if rv == RetVal.OK:
+            wsId = self.getWorkspaceID(workspace)
+            url = self.url + "/workspaces/%s/user/%s/time-entries" % (wsId, self.userID)
+            params = {"description": description}
+            if start != None:
+                params["start"] = clockifyTime(start)
+            if projectName != None:
+                params["project"] = await self.getProjectID(projectName, workspace)
+            if end:
+                params["end"] = end
+
+            rv = await self._request(url, body=params, typ="GET")
+            if rv.ok:
+                data = rv.json()
+                rv = RetVal.OK
+            else:
+                self.logger.warning("Error getTimeEntryForUser, status code=%d, msg=%s" % (rv.status_code, rv.reason))
+                rv = RetVal.ERR
+
+        return rv, data
+
+    async def addEntry(self, start, description, projectName, userMail, workspace,
+                       timeZone="Z", end=None, billable=False, tagNames=None, taskName=None):
+        """Same as ClockifyAPI.addEntry."""
+        data = None
+        rv = self._checkUser(userMail)
+        if rv != RetVal.OK:
+            return rv, data
+
+        url = self.url + "/workspaces/%s/time-entries" % self.getWorkspaceID(workspace)
+        params = {
+            "start": clockifyTime(start),
+            "billable": billable,
+            "description": description
+        }
+        end_plus = None
+        if projectName != None:
+            params["projectId"] = await self.getProjectID(projectName, workspace)
+            if taskName != None:
+                params["taskId"] = await self.getTaskID(taskName, params["projectId"], workspace)
+        if end != None:
+            end_plus = shiftClockifyTime(end, datetime.timedelta(hours=3))
+            params["end"] = clockifyTime(end)
+        if tagNames != None:
+            params["tagIds"] = [await self.getTagID(tag, workspace) for tag in tagNames]
+
+        wanted = TimeEntry(None, toEpoch(start), toEpoch(end) if end != None else None,
+                           description, params.get("projectId"), internTags(params.get("tagIds", ())),
+                           billable, self.userID)
+        index = self._prefetchedEntries(wanted.start)
+        if index != None:
+            entr = index.get(wanted.key(), [])
+        else:
+            rv, entr = await self.getTimeEntryForUser(userMail, workspace, description, projectName,
+                                                      start, timeZone=timeZone, end=end_plus)
+            if rv != RetVal.OK:
+                return RetVal.ERR, data
+            entr = [TimeEntry.fromClockify(d) for d in entr]
+
+        entr = [d for d in entr if entryMatches(wanted, d, compareTags=tagNames != None)]
+        if entr != []:
+            return RetVal.EXISTS, entr[0]
+
+        if index != None:
+            # filed as pending while the POST is awaited, so a concurrent addEntry of the same entry finds it
+            addToEntryIndex(index, wanted)
+        try:
+            rv = await self._request(url, body=params, typ="POST")
+        finally:
+            if index != None:
+                discardFromEntryIndex(index, wanted)
+        self.logger.info("Adding entry: %s" % json.dumps(params))
+        if rv.ok:
+            data = TimeEntry.fromClockify(rv.json())
+            if index != None:
+                addToEntryIndex(index, data)
+            return RetVal.OK, data
+
+        self.logger.warning("Error adding time entrs, status code=%d, msg=%s" % (rv.status_code, rv.text))
+        return RetVal.ERR, data
+
+    async def deleteEntry(self, entryID, workspace):
+        url = self.url + "/workspaces/%s/time-entries/%s" % (self.getWorkspaceID(workspace), entryID)
+        rv = await self._request(url, typ="DELETE")
+        if rv.ok:
+            return RetVal.OK
+        if rv.status_code == 404:
+            return RetVal.NOT_FOUND
+        self.logger.warning("Error deleteEntry, status code=%d, msg=%s" % (rv.status_code, rv.reason))
+        return RetVal.ERR
@@ -7,12 +7,79 @@ __maintainer__ = "Markus Proeller"
 __email__ = "markus.proeller@pieye.org"
 
 import datetime
+import hashlib
 import json
 import logging
+import threading
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from Metrics import getMetrics
+from RateLimiter import getRateLimiter, retryAfterSeconds
+from TimeConversion import clockifyTime, shiftClockifyTime, toEpoch
+from TimeEntry import TimeEntry, internTags
+
+# documented limit of the Clockify API per API key
+CLOCKIFY_RATE_LIMIT = 50
+
+
+def indexBy(items, key, value="id", lower=False):
+    """Builds a dict lookup over a list of API objects, the last object wins on duplicate keys."""
+    index = {}
+    for item in items:
+        k = item[key]
+        if lower and k != None:
+            k = k.lower()
+        index[k] = item[value]
+    return index
+
+
+def addToEntryIndex(index, entry):
+    """Files a clockify time entry (TimeEntry) under its start, end and description. The remaining
+    fields (project, user, tags) are compared on the few candidates sharing that key."""
+    index.setdefault(entry.key(), []).append(entry)
+
+
+def discardFromEntryIndex(index, entry):
+    """Drops this very entry object (e.g. a pending one, see addEntry) from the index."""
+    key = entry.key()
+    remaining = [e for e in index.get(key, []) if e is not entry]
+    if remaining == []:
+        index.pop(key, None)
+    else:
+        index[key] = remaining
+
+
+def removeFromEntryIndex(index, entryIds, key=None):
+    """Drops the entries with the given IDs from the index, only from under `key` if given (see
+    TimeEntry.key), otherwise one pass over the whole index."""
+    keys = list(index) if key == None else [key] if key in index else []
+    for key in keys:
+        entries = index[key]
+        remaining = [e for e in entries if e.id not in entryIds]
+        if remaining == []:
+            del index[key]
+        elif len(remaining) != len(entries):
+            index[key] = remaining
+
+
+def entryMatches(wanted, entry, compareTags=False):
+    """Checks if a clockify time entry is the one addEntry would create, both given as TimeEntry with
+    the project, user and tag IDs resolved. The project is only compared when `wanted` has one."""
+    if wanted.start != entry.start or wanted.end != entry.end or wanted.description != entry.description:
+        return False
+    if wanted.project != None and wanted.project != entry.project:
+        return False
+    if wanted.userId != entry.userId:
+        return False
+    if compareTags and wanted.tags != entry.tags:
+        return False
+    return True
 
 
 class RetVal(Enum):
@@ -20,6 +87,7 @@ class RetVal(Enum):
     ERR = 1
     EXISTS = 2
     FORBIDDEN = 3
+    NOT_FOUND = 4
 
 
 class HourlyRate:
@@ -64,162 +132,437 @@ class MemberShip:
         return self.memberShip
 
 
+class UserContext:
+    """Identity behind one API token, resolved once by the constructor and never changed afterwards."""
+
+    __slots__ = ("token", "email", "userID", "name")
+
+    def __init__(self, token, email, userID, name):
+        object.__setattr__(self, "token", token)
+        object.__setattr__(self, "email", email)
+        object.__setattr__(self, "userID", userID)
+        object.__setattr__(self, "name", name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserContext is immutable")
+
+
+class _ThreadState(threading.local):
+    """Context of the loaded user and sessions of one thread, new threads start with the user of the
+    first API token."""
+
+    def __init__(self, defaults):
+        self.__dict__.update(defaults)
+        self.sessions = {}
+
+
 class ClockifyAPI:
-    def __init__(self, apiToken, adminEmail="", reqTimeout=0.01, fallbackUserMail=None):
+    # flags forcing a refetch of the metadata kinds kept in the MetadataCache
+    _SYNC_FLAGS = {"clients": "_syncClients", "projects": "_syncProjects", "users": "_syncUsers",
+                   "groups": "_syncGroups", "tags": "_syncTags"}
+
+    def __init__(self, apiToken, adminEmail="", reqTimeout=0.01, fallbackUserMail=None,
+                 sessionFactory=None, poolSize=10, rateLimit=CLOCKIFY_RATE_LIMIT, maxRetries=5,
+                 pageSize=200, pageWorkers=4, cache=None, taskCacheSize=100,
+                 url='https://api.clockify.me/api/v1'):
         self.logger = logging.getLogger('clockify-automation')
-        self.url = 'https://api.clockify.me/api/v1'
-        self.urlWorking = 'https://api.clockify.me/api/v1'
+        self.url = url
+        self.urlWorking = url
         self._syncClients = True
         self._syncUsers = True
         self._syncProjects = True
         self._syncTags = True
         self._syncGroups = True
-        self._syncTasks = True
+        self._cache = cache
+        self._fromCache = set()
         self._adminEmail = adminEmail
-        self._reqTimeout = reqTimeout
+        # reqTimeout is kept as the minimal interval between two requests, the actual pacing is done
+        # by a token bucket per API token which only backs off when the server answers with 429
+        if reqTimeout:
+            rateLimit = min(rateLimit, 1.0 / reqTimeout)
+        self._rateLimit = rateLimit
+        self._maxRetries = maxRetries
+        self._pageSize = pageSize
+        self._pageWorkers = pageWorkers
+        self._pagePool = None
         self.fallbackUserMail = fallbackUserMail
 
-        self._APIusers = []
+        # one keep-alive session per API token and thread, the factory can be swapped for a local stand-in
+        self._poolSize = poolSize
+        self._sessionFactory = sessionFactory if sessionFactory != None else self._createSession
+        self._allSessions = []
+        self._sessionsLock = threading.Lock()
+
+        # the loaded user is kept per thread so worker threads can switch users independently
+        self._stateDefaults = {"context": None}
+        self._state = _ThreadState(self._stateDefaults)
+
+        # time entries prefetched per user ID for duplicate detection, (start, end, index)
+        self._entryIndex = {}
+        self._entryIndexLock = threading.Lock()
+
+        # tasks per project ID, least recently used first
+        self._taskCacheSize = taskCacheSize
+        self._tasks = OrderedDict()
+        self._tasksLock = threading.Lock()
+
+        # one token or a list of tokens of several users, checked on first use (see _ensureUsers)
+        self._tokens = [apiToken] if isinstance(apiToken, str) else list(apiToken)
+        self._APIusers = None
+        self._usersError = None
+        self._tokenErrors = {}
+        self._contexts = {}
+        self._usersLock = threading.Lock()
+        self.workspaces = None
+        self._workspacesLock = threading.Lock()
+        # the projects are loaded by whichever worker needs them first
+        self._projectsLock = threading.Lock()
+
+    @staticmethod
+    def _cacheKey(token):
+        # the metadata cache is keyed by a digest, the token itself is not written to disk
+        return "clockify:%s" % hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+    def _ensureUsers(self):
+        """Resolves the API tokens to their users the first time a user is needed, so creating the
+        client costs no request. Tokens validated by an earlier run within the cache TTL are taken
+        from the metadata cache, the others are checked in parallel. A rejected token only fails the
+        calls for its user, the admin token has to be valid."""
+        if self._APIusers != None:
+            return
+        with self._usersLock:
+            if self._APIusers != None:
+                return
+            # a rejected token is not checked again for every following call
+            if self._usersError != None:
+                raise self._usersError
+            with ThreadPoolExecutor(max_workers=max(1, min(len(self._tokens), self._poolSize))) as pool:
+                checks = [(token, pool.submit(self._validateToken, token)) for token in self._tokens]
+            users = []
+            tokenErrors = {}
+            for token, check in checks:
+                try:
+                    users.append(check.result())
+                except RuntimeError as e:
+                    self.logger.error(str(e))
+                    tokenErrors[token] = e
+            try:
+                self._setUsers(users, tokenErrors)
+            except RuntimeError as e:
+                self._usersError = e
+                raise
+            self._tokenErrors = tokenErrors
+
+    def _setUsers(self, users, tokenErrors=None):
+        adminEmail = self._adminEmail
         adminFound = False
         fallbackFound = False
-        for token in [apiToken]:
-            self.logger.info("testing clockify APIKey %s" % token)
+        contexts = {}
+        for user in users:
+            contexts[user["email"].lower()] = UserContext(user["token"], user["email"], user["id"], user["name"])
 
-            self.apiToken = token
-            url = self.url + "/user"
-            rv = self._request(url)
-            if rv.status_code != 200:
-                raise RuntimeError("error loading user (API token %s), status code %s" % (token, str(rv.status_code)))
-
-            rv = rv.json()
-            user = {}
-            user["name"] = rv["name"]
-            user["token"] = token
-            user["email"] = rv["email"]
-            user["id"] = rv["id"]
-
-            if (rv["status"].upper() != "ACTIVE") and (rv["status"].upper() != "PENDING_EMAIL_VERIFICATION"):
-                raise RuntimeError(
-                    "user '%s' is not an active user in clockify. Please activate the user for the migration process" %
-                    user["email"])
-
-            self._APIusers.append(user)
-
-            if rv["email"].lower() == adminEmail.lower():
+            if user["email"].lower() == adminEmail.lower():
                 adminFound = True
 
             if self.fallbackUserMail != None:
-                if rv["email"].lower() == self.fallbackUserMail.lower():
+                if user["email"].lower() == self.fallbackUserMail.lower():
                     fallbackFound = True
 
-            self.logger.info("...ok, key resolved to email %s" % rv["email"])
-
         if not adminFound:
-            raise RuntimeError("admin mail address was given as %s but not found in clockify API tokens" % adminEmail)
+            raise RuntimeError("admin mail address was given as %s but not found in clockify API tokens%s" % (
+                adminEmail, self._tokenErrorText(tokenErrors)))
 
         if fallbackFound == False and self.fallbackUserMail != None:
             raise RuntimeError(
                 "falback user mail address was given as %s but not found in clockify API tokens" % self.fallbackUserMail)
 
-        self._loadedUserEmail = None
-        self._loadUser(self._APIusers[0]["email"])
-
-        self._getWorkspaces()
-
-    def _loadAdmin(self):
-        return self._loadUser(self._adminEmail)
+        self._contexts = contexts
+        self._stateDefaults["context"] = contexts[users[0]["email"].lower()]
+        self._APIusers = users
 
-    def _loadUser(self, userMail):
-        mailChk = self._loadedUserEmail
-        if mailChk == None:
-            mailChk = ""
+    def _validateToken(self, token):
+        if self._cache != None:
+            user = self._cache.get(self._cacheKey(token), "user")
+            if user != None:
+                self.logger.info("clockify APIKey %s resolved to email %s (cached)" % (token, user["email"]))
+                return dict(user, token=token)
 
-        if userMail.lower() == mailChk.lower():
-            return RetVal.OK
+        self.logger.info("testing clockify APIKey %s" % token)
 
-        userLoaded = False
-        for user in self._APIusers:
-            if user["email"].lower() == userMail.lower():
-                self.apiToken = user["token"]
-                self.email = user["email"]
-                self.userID = user["id"]
-                url = self.url + "/user"
-                rv = self._request(url)
-                if rv.status_code != 200:
-                    raise RuntimeError("error loading user %s, status code %s" % (user["email"], str(rv.status_code)))
-                userLoaded = True
-                self._loadedUserEmail = user["email"]
-                break
+        url = self.url + "/user"
+        rv = self._send("GET", url, token=token)
+        if rv.status_code != 200:
+            raise RuntimeError("error loading user (API token %s), status code %s" % (token, str(rv.status_code)))
 
-        if userLoaded == False:
-            rv = RetVal.ERR
-            self.logger.warning("user %s not found" % userMail)
-        else:
-            rv = RetVal.OK
+        rv = rv.json()
+        user = {}
+        user["name"] = rv["name"]
+        user["token"] = token
+        user["email"] = rv["email"]
+        user["id"] = rv["id"]
 
-        return rv
+        if (rv["status"].upper() != "ACTIVE") and (rv["status"].upper() != "PENDING_EMAIL_VERIFICATION"):
+            raise RuntimeError(
+                "user '%s' is not an active user in clockify. Please activate the user for the migration process" %
+                user["email"])
+
+        self.logger.info("...ok, key resolved to email %s" % rv["email"])
+        if self._cache != None:
+            self._cache.put(self._cacheKey(token), "user", {k: v for k, v in user.items() if k != "token"})
+        return user
+
+    @property
+    def context(self):
+        self._ensureUsers()
+        if self._state.context == None:
+            # the thread touched the client before the tokens were resolved
+            self._state.context = self._stateDefaults["context"]
+        return self._state.context
+
+    @property
+    def apiToken(self):
+        return self.context.token
+
+    @property
+    def email(self):
+        return self.context.email
+
+    @property
+    def userID(self):
+        return self.context.userID
+
+    @property
+    def _loadedUserEmail(self):
+        return self.context.email
+
+    @staticmethod
+    def _tokenErrorText(tokenErrors):
+        if not tokenErrors:
+            return ""
+        return " (rejected tokens: %s)" % "; ".join(str(e) for e in tokenErrors.values())
+
+    def _userToken(self, userMail):
+        self._ensureUsers()
+        context = self._contexts.get(userMail.lower())
+        if context == None:
+            raise RuntimeError("user %s not found in clockify API tokens%s" % (
+                userMail, self._tokenErrorText(self._tokenErrors)))
+        return context.token
 
-    def multiGetRequest(self, url, idKey="id"):
-        headers = {
-            'X-Api-Key': self.apiToken}
+    def _loadAdmin(self):
+        return self._loadUser(self._adminEmail)
 
-        curPage = 1
-        rvData = []
+    def _loadUser(self, userMail):
+        # switching users only selects another context of this thread, the tokens were checked once
+        if userMail == None:
+            return RetVal.ERR
+        self._ensureUsers()
+        context = self._contexts.get(userMail.lower())
+        if context == None:
+            if self._tokenErrors:
+                # the user may be behind one of the rejected tokens
+                raise RuntimeError("user %s not found in clockify API tokens%s" % (
+                    userMail, self._tokenErrorText(self._tokenErrors)))
+            self.logger.warning("user %s not found" % userMail)
+            return RetVal.ERR
+        self._state.context = context
+        return RetVal.OK
+
+    def _createSession(self, token):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._poolSize, pool_maxsize=self._poolSize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "X-Api-Key": token,
+            "Content-Type": "application/json",
+            "Connection": "keep-alive"})
+        return session
+
+    def _getSession(self, token=None):
+        if token == None:
+            token = self.apiToken
+        sessions = self._state.sessions
+        session = sessions.get(token)
+        if session == None:
+            session = self._sessionFactory(token)
+            sessions[token] = session
+            with self._sessionsLock:
+                self._allSessions.append(session)
+        return session
+
+    def _getRateLimiter(self, token=None):
+        if token == None:
+            token = self.apiToken
+        return getRateLimiter("clockify:%s" % token, self._rateLimit)
+
+    def _send(self, method, url, params=None, json=None, token=None):
+        if token == None:
+            token = self.apiToken
+        session = self._getSession(token)
+        limiter = self._getRateLimiter(token)
+        metrics = getMetrics()
+        attempt = 0
+        while True:
+            metrics.recordSleep("clockify", limiter.acquire())
+            started = time.perf_counter()
+            response = session.request(method, url, params=params, json=json)
+            metrics.record("clockify", method, url, response.status_code, time.perf_counter() - started,
+                           len(response.request.body or b""), len(response.content))
+            if response.status_code != 429:
+                limiter.success()
+                if response.status_code == 401 and self._cache != None:
+                    # the token was revoked since it was validated, check it again next run
+                    self._cache.invalidate(self._cacheKey(token), "user")
+                return response
+            if attempt >= self._maxRetries:
+                self.logger.warning("giving up on %s %s after %d rate limited attempts" % (method, url, attempt + 1))
+                return response
+            delay = limiter.backoff(retryAfterSeconds(response.headers))
+            self.logger.warning("rate limited on %s %s, retrying in %.2fs" % (method, url, delay))
+            attempt += 1
+
+    def close(self):
+        if self._pagePool != None:
+            self._pagePool.shutdown(wait=True)
+            self._pagePool = None
+        with self._sessionsLock:
+            for session in self._allSessions:
+                session.close()
+            self._allSessions = []
+        self._state = _ThreadState(self._stateDefaults)
+
+    def _getPagePool(self):
+        # kept for the lifetime of the API object so the page threads keep their sessions alive
+        with self._sessionsLock:
+            if self._pagePool == None:
+                self._pagePool = ThreadPoolExecutor(max_workers=self._pageWorkers)
+            return self._pagePool
+
+    def multiGetRequest(self, url, idKey="id", params=None, pageSize=None, token=None):
+        return list(self.multiGetIter(url, idKey, params, pageSize, token))
+
+    def multiGetIter(self, url, idKey="id", params=None, pageSize=None, token=None):
+        """Yields the records of a paginated endpoint as the pages arrive.
+
+        Once the first page comes back full, the following pages are requested `pageWorkers` at a
+        time. Paging stops at the first short page or at a page which was already seen.
+        """
+        if token == None:
+            token = self.apiToken
+        if pageSize == None:
+            pageSize = self._pageSize
+
+        def fetch(page):
+            body = dict(params) if params != None else {}
+            body["page"] = page
+            body["page-size"] = pageSize
+            return self._send("GET", url, params=body, token=token)
+
+        # the page size is adapted down if the endpoint refuses it
         while True:
-            body = {"page": curPage, "page-size": 50}
-            rv = requests.get(url, headers=headers, params=body)
-            if rv.status_code == 200:
+            rv = fetch(1)
+            if rv.status_code == 400 and pageSize > 50:
+                pageSize = max(50, pageSize // 2)
+                self.logger.info("page size refused by %s, retrying with %d" % (url, pageSize))
+                continue
+            break
+
+        seen = set()
+        nextPage = 2
+        pending = deque()
+        try:
+            while True:
+                if rv.status_code != 200:
+                    raise RuntimeError("get on url %s failed with status code %d" % (url, rv.status_code))
                 data = rv.json()
-                if len(data) < 50:
-                    rvData.extend(data)
+                if len(data) > 0 and data[0][idKey] in seen:
                     break
-                else:
-                    # check if we got new data
-                    chkID = data[0][idKey]
-                    if not any(d[idKey] == chkID for d in rvData):
-                        rvData.extend(data)
-                    else:
-                        break
-                curPage += 1
-            else:
-                raise RuntimeError("get on url %s failed with status code %d" % (url, rv.status_code))
-        return rvData
+                for d in data:
+                    if d[idKey] not in seen:
+                        seen.add(d[idKey])
+                        yield d
+                if len(data) < pageSize:
+                    break
+
+                pool = self._getPagePool()
+                while len(pending) < self._pageWorkers:
+                    pending.append(pool.submit(fetch, nextPage))
+                    nextPage += 1
+                rv = pending.popleft().result()
+        finally:
+            for f in pending:
+                f.cancel()
 
     def _request(self, url, body=None, typ="GET"):
-        headers = {
-            'X-Api-Key': self.apiToken}
         if typ == "GET":
-            response = requests.get(url, headers=headers, params=body)
+            response = self._send("GET", url, params=body)
         elif typ == "POST":
-            response = requests.post(url, headers=headers, json=body)
+            response = self._send("POST", url, json=body)
+        elif typ == "PUT":
+            response = self._send("PUT", url, json=body)
         elif typ == "DELETE":
-            response = requests.delete(url, headers=headers)
+            response = self._send("DELETE", url)
         else:
             raise RuntimeError("invalid request type %s" % typ)
-        time.sleep(self._reqTimeout)
         return response
 
+    def _loadCached(self, wsId, kind):
+        if self._cache == None:
+            return None
+        data = self._cache.get(wsId, kind)
+        if data != None:
+            self._fromCache.add(kind)
+            self.logger.info("using cached clockify %s of workspace %s" % (kind, wsId))
+        return data
+
+    def _storeCached(self, wsId, kind, data):
+        self._fromCache.discard(kind)
+        if self._cache != None:
+            self._cache.put(wsId, kind, data)
+
+    def _invalidateCached(self, wsId, kind):
+        if self._cache != None:
+            self._cache.invalidate(wsId, kind)
+
+    def _refreshCached(self, kind, workspace):
+        # a lookup missed on data served from the cache, it may be outdated so fetch it once again
+        if kind not in self._fromCache:
+            return False
+        self.logger.info("cached clockify %s are outdated, refreshing" % kind)
+        self._invalidateCached(self.getWorkspaceID(workspace), kind)
+        setattr(self, self._SYNC_FLAGS[kind], True)
+        return True
+
     def getWorkspaces(self):
+        if self.workspaces == None:
+            with self._workspacesLock:
+                if self.workspaces == None:
+                    self._getWorkspaces()
         return self.workspaces
 
     def getWorkspaceID(self, workspaceName):
-        wsId = None
-        workspaces = self.getWorkspaces()
-        for ws in workspaces:
-            if ws["name"] == workspaceName:
-                wsId = ws["id"]
+        self.getWorkspaces()
+        wsId = self._workspaceIds.get(workspaceName)
         if wsId == None:
-            raise RuntimeError("Workspace %s not found. Available workspaces: %s" % (workspaceName, workspaces))
+            raise RuntimeError("Workspace %s not found. Available workspaces: %s" % (workspaceName, self.workspaces))
         return wsId
 
     def _getWorkspaces(self):
-        url = self.url + "/workspaces"
-        rv = self._request(url)
-        if rv.status_code == 200:
-            self.workspaces = rv.json()
-        else:
-            raise RuntimeError("Querying workspaces for user %s failed, status code=%d, msg=%s" % (
-                self._APIusers[0]["email"], rv.status_code, rv.text))
+        # the workspaces of the first token, like the tokens themselves reused from the cache
+        token = self._tokens[0]
+        workspaces = self._cache.get(self._cacheKey(token), "workspaces") if self._cache != None else None
+        if workspaces == None:
+            url = self.url + "/workspaces"
+            rv = self._send("GET", url, token=token)
+            if rv.status_code != 200:
+                raise RuntimeError("Querying workspaces (API token %s) failed, status code=%d, msg=%s" % (
+                    token, rv.status_code, rv.text))
+            workspaces = rv.json()
+            if self._cache != None:
+                self._cache.put(self._cacheKey(token), "workspaces", workspaces)
+        self._workspaceIds = indexBy(workspaces, "name")
+        self.workspaces = workspaces
         return self.workspaces
 
     def addClient(self, name, workspace):
@@ -242,6 +585,7 @@ class ClockifyAPI:
         else:
             rv = RetVal.OK
             self._syncClients = True
+            self._invalidateCached(wsId, "clients")
 
         self._loadUser(curUser)
 
@@ -253,32 +597,59 @@ class ClockifyAPI:
             self._loadAdmin()
 
             wsId = self.getWorkspaceID(workspace)
-            url = self.url + "/workspaces/%s/clients" % wsId
-            self.clients = self.multiGetRequest(url)
+            self.clients = self._loadCached(wsId, "clients")
+            if self.clients == None:
+                url = self.url + "/workspaces/%s/clients" % wsId
+                self.clients = self.multiGetRequest(url)
+                self._storeCached(wsId, "clients", self.clients)
+                self.logger.info("finished getting clockify clients")
+            self._clientIds = indexBy(self.clients, "name")
             self._syncClients = False
 
-            self.logger.info("finished getting clockify clients, saving results to clockify_clients.json")
-            f = open("clockify_clients.json", "w")
-            f.write(json.dumps(self.clients, indent=2))
-            f.close()
-
             self._loadUser(curUser)
         return self.clients
 
-    def getTasksOnProject(self, workspace, projectName):
+    def _projectTasks(self, wsId, projectId, refresh=False):
+        """Tasks of the project and their name -> ID index, kept for the `taskCacheSize` most recently
+        used projects. Returns the cached pair and whether it came from the cache."""
+        with self._tasksLock:
+            tasks = None if refresh else self._tasks.get(projectId)
+            if tasks != None:
+                self._tasks.move_to_end(projectId)
+                return tasks, True
+
         curUser = self._loadedUserEmail
         self._loadAdmin()
+        url = self.url + "/workspaces/%s/projects/%s/tasks" % (wsId, projectId)
+        pTasks = self.multiGetRequest(url)
+        self._loadUser(curUser)
+
+        tasks = (pTasks, indexBy(pTasks, "name"))
+        with self._tasksLock:
+            self._tasks[projectId] = tasks
+            self._tasks.move_to_end(projectId)
+            while len(self._tasks) > self._taskCacheSize:
+                self._tasks.popitem(last=False)
+        return tasks, False
 
+    def getTasksOnProject(self, workspace, projectName):
         wsId = self.getWorkspaceID(workspace)
         pId = self.getProjectID(projectName, workspace)
-
-        url = self.url + "/workspaces/%s/projects/%s/tasks" % (wsId, pId)
-        self.pTasks = self.multiGetRequest(url)
-
-        self._loadUser(curUser)
-
+        (self.pTasks, _), _ = self._projectTasks(wsId, pId)
         return self.pTasks
 
+    def getTaskID(self, taskName, projectId, workspace):
+        wsId = self.getWorkspaceID(workspace)
+        (_, taskIds), cached = self._projectTasks(wsId, projectId)
+        tId = taskIds.get(taskName)
+        if tId == None and cached:
+            # the task may have been created since the project tasks were cached
+            (_, taskIds), _ = self._projectTasks(wsId, projectId, refresh=True)
+            tId = taskIds.get(taskName)
+        if tId == None:
+            raise RuntimeError("Task %s not found." % (taskName))
+        return tId
+
     def getTaskIdFromTasks(self, taskName, pTasks):
         tId = None
         if pTasks != None:
@@ -290,38 +661,48 @@ class ClockifyAPI:
         return tId
 
     def getClientID(self, client, workspace, skipCliQuery=False):
-        clId = None
-        if skipCliQuery:
-            clients = self.clients
-        else:
-            clients = self.getClients(workspace)
+        if not skipCliQuery:
+            self.getClients(workspace)
 
-        for c in clients:
-            if c["name"] == client:
-                clId = c["id"]
+        clId = self._clientIds.get(client)
+        if clId == None and self._refreshCached("clients", workspace):
+            self.getClients(workspace)
+            clId = self._clientIds.get(client)
         if clId == None:
             raise RuntimeError("Client %s not found in workspace %s" % (client, workspace))
         return clId
 
     def getProjects(self, workspace, skipPrjQuery=False):
-        if self._syncProjects == True:
-            curUser = self._loadedUserEmail
-            self.projects = []
+        with self._projectsLock:
+            return self._getProjects(workspace)
 
-            for user in self._APIusers:
-                self.logger.info("synchronizing clockify projects for user %s..." % user["email"])
-                self._loadUser(user["email"])
+    def _getProjects(self, workspace):
+        if self._syncProjects == True:
+            wsId = self.getWorkspaceID(workspace)
+            self._ensureUsers()
+            self.projects = self._loadCached(wsId, "projects")
 
-                wsId = self.getWorkspaceID(workspace)
+            if self.projects == None:
                 url = self.url + "/workspaces/%s/projects" % wsId
-                projects = self.multiGetRequest(url)
-                self.projects.extend(projects)
 
-            self.logger.info("finished synchronizing clockify projects, saving results to clockify_projects.json")
-            f = open("clockify_projects.json", "w")
-            f.write(json.dumps(self.projects, indent=2))
-            f.close()
-            self._loadUser(curUser)
+                def fetch(user):
+                    self.logger.info("synchronizing clockify projects for user %s..." % user["email"])
+                    return self.multiGetRequest(url, token=user["token"])
+
+                # the projects of every token are fetched at once, the list keeps the order of the tokens and
+                # lists a project seen by several users once
+                self.projects = []
+                seen = set()
+                with ThreadPoolExecutor(max_workers=max(1, min(len(self._APIusers), self._poolSize))) as pool:
+                    for projects in pool.map(fetch, self._APIusers):
+                        for project in projects:
+                            if project["id"] not in seen:
+                                seen.add(project["id"])
+                                self.projects.append(project)
+                self._storeCached(wsId, "projects", self.projects)
+                self.logger.info("finished synchronizing clockify projects")
+
+            self._projectIds = indexBy(self.projects, "name")
             self._syncProjects = False
 
         return self.projects
@@ -337,30 +718,28 @@ class ClockifyAPI:
                 self.projects = []
 
                 wsId = self.getWorkspaceID(workspace)
-                url = self.urlWorking + "/workspaces/%s/projects/" % wsId
-
-                self.projects = self.multiGetRequest(url)
+                self.projects = self._loadCached(wsId, "projects")
+                if self.projects == None:
+                    url = self.urlWorking + "/workspaces/%s/projects/" % wsId
+                    self.projects = self.multiGetRequest(url)
+                    self._storeCached(wsId, "projects", self.projects)
+                    self.logger.info("Finished getting clockify projects")
+
+                self._projectIds = indexBy(self.projects, "name")
                 self._syncProjects = False
 
-                self.logger.info("Finished getting clockify projects, saving results to clockify_projects.json")
-                f = open("clockify_projects.json", "w")
-                f.write(json.dumps(self.projects, indent=2))
-                f.close()
-
             self._loadUser(curUser)
 
         return self.projects
 
     def getProjectID(self, project, workspace, skipPrjQuery=False):
-        pId = None
-        if skipPrjQuery:
-            projects = self.projects
-        else:
-            projects = self.getProjects(workspace, skipPrjQuery)
+        if not skipPrjQuery:
+            self.getProjects(workspace, skipPrjQuery)
 
-        for p in projects:
-            if p["name"] == project:
-                pId = p["id"]
+        pId = self._projectIds.get(project)
+        if pId == None and self._refreshCached("projects", workspace):
+            self.getProjects(workspace)
+            pId = self._projectIds.get(project)
         if pId == None:
             raise RuntimeError("Project %s not found in workspace %s" % (project, workspace))
         return pId
@@ -371,16 +750,19 @@ class ClockifyAPI:
             self._loadAdmin()
 
             wsId = self.getWorkspaceID(workspace)
-            url = self.url + "/workspace/%s/users" % wsId
-            rv = self._request(url, typ="GET")
-            self.users = rv.json()
+            self.users = self._loadCached(wsId, "users")
+            if self.users == None:
+                url = self.url + "/workspace/%s/users" % wsId
+                rv = self._request(url, typ="GET")
+                self.users = rv.json()
+                self._storeCached(wsId, "users", self.users)
+                self.logger.info("finsihed getting clockify users")
+
+            self._userIdsByName = indexBy(self.users, "name")
+            self._userIdsByMail = indexBy(self.users, "email", lower=True)
+            self._userMailsById = indexBy(self.users, "id", "email")
             self._syncUsers = False
 
-            self.logger.info("finsihed getting clockify users, saving results to clockify_users.json")
-            f = open("clockify_users.json", "w")
-            f.write(json.dumps(self.users, indent=2))
-            f.close()
-
             self._loadUser(curUser)
         return self.users
 
@@ -395,31 +777,31 @@ class ClockifyAPI:
         return userIds
 
     def getUserIDByName(self, user, workspace):
-        uId = None
-        users = self.getUsers(workspace)
-        for u in users:
-            if u["name"] == user:
-                uId = u["id"]
+        self.getUsers(workspace)
+        uId = self._userIdsByName.get(user)
+        if uId == None and self._refreshCached("users", workspace):
+            self.getUsers(workspace)
+            uId = self._userIdsByName.get(user)
         if uId == None:
             raise RuntimeError("User %s not found in workspace %s" % (user, workspace))
         return uId
 
     def getUserMailById(self, userID, workspace):
-        mail = None
-        users = self.getUsers(workspace)
-        for u in users:
-            if u["id"] == userID:
-                mail = u["email"]
+        self.getUsers(workspace)
+        mail = self._userMailsById.get(userID)
+        if mail == None and self._refreshCached("users", workspace):
+            self.getUsers(workspace)
+            mail = self._userMailsById.get(userID)
         if mail == None:
             raise RuntimeError("User ID %s not found in workspace %s" % (userID, workspace))
         return mail
 
     def getUserIDByMail(self, email, workspace):
-        uId = None
-        users = self.getUsers(workspace)
-        for u in users:
-            if u["email"] == email:
-                uId = u["id"]
+        self.getUsers(workspace)
+        uId = self._userIdsByMail.get(email.lower())
+        if uId == None and self._refreshCached("users", workspace):
+            self.getUsers(workspace)
+            uId = self._userIdsByMail.get(email.lower())
         if uId == None:
             raise RuntimeError("User %s not found in workspace %s" % (email, workspace))
         return uId
@@ -453,6 +835,7 @@ class ClockifyAPI:
         rv = self._request(url, body=params, typ="POST")
         if rv.status_code == 201:
             self._syncProjects = True
+            self._invalidateCached(wsId, "projects")
             rv = RetVal.OK
         elif rv.status_code == 400:
             rv = RetVal.EXISTS
@@ -520,17 +903,18 @@ class ClockifyAPI:
             curUser = self._loadedUserEmail
             self._loadAdmin()
 
-            self.userGroups = []
             wsId = self.getWorkspaceID(workspace)
-            url = self.urlWorking + "/workspaces/%s/userGroups" % wsId
-            self.userGroups = self.multiGetRequest(url)
+            self.userGroups = self._loadCached(wsId, "groups")
+            if self.userGroups == None:
+                url = self.urlWorking + "/workspaces/%s/userGroups" % wsId
+                self.userGroups = self.multiGetRequest(url)
+                self._storeCached(wsId, "groups", self.userGroups)
+                self.logger.info("Finished getting clockify groups")
+
+            self._groupIdsByName = indexBy(self.userGroups, "name")
+            self._groupNamesById = indexBy(self.userGroups, "id", "name")
             self._syncGroups = False
 
-            self.logger.info("Finished getting clockify groups, saving results to clockify_groups.json")
-            f = open("clockify_groups.json", "w")
-            f.write(json.dumps(self.userGroups, indent=2))
-            f.close()
-
             self._loadUser(curUser)
         return self.userGroups
 
@@ -545,6 +929,7 @@ class ClockifyAPI:
         rv = self._request(url, body=params, typ="POST")
         if rv.status_code == 201:
             self._syncGroups = True
+            self._invalidateCached(wsId, "groups")
             rv = RetVal.OK
         elif rv.status_code == 400:
             rv = RetVal.EXISTS
@@ -557,21 +942,21 @@ class ClockifyAPI:
         return rv
 
     def getUserGroupName(self, userGroupID, workspace):
-        uName = None
-        userGroups = self.getUserGroups(workspace)
-        for u in userGroups:
-            if u["id"] == userGroupID:
-                uName = u["name"]
+        self.getUserGroups(workspace)
+        uName = self._groupNamesById.get(userGroupID)
+        if uName == None and self._refreshCached("groups", workspace):
+            self.getUserGroups(workspace)
+            uName = self._groupNamesById.get(userGroupID)
         if uName == None:
             raise RuntimeError("User Group %s not found in workspace %s" % (userGroupID, workspace))
         return uName
 
     def getUserGroupID(self, userGroupName, workspace):
-        uId = None
-        userGroups = self.getUserGroups(workspace)
-        for u in userGroups:
-            if u["name"] == userGroupName:
-                uId = u["id"]
+        self.getUserGroups(workspace)
+        uId = self._groupIdsByName.get(userGroupName)
+        if uId == None and self._refreshCached("groups", workspace):
+            self.getUserGroups(workspace)
+            uId = self._groupIdsByName.get(userGroupName)
         if uId == None:
             raise RuntimeError("User Group %s not found in workspace %s" % (userGroupName, workspace))
         return uId
@@ -581,17 +966,18 @@ class ClockifyAPI:
             curUser = self._loadedUserEmail
             self._loadAdmin()
 
-            self.tags = []
             wsId = self.getWorkspaceID(workspace)
-            url = self.url + "/workspaces/%s/tags" % wsId
-            self.tags = self.multiGetRequest(url)
+            self.tags = self._loadCached(wsId, "tags")
+            if self.tags == None:
+                url = self.url + "/workspaces/%s/tags" % wsId
+                self.tags = self.multiGetRequest(url)
+                self._storeCached(wsId, "tags", self.tags)
+                self.logger.info("Finished getting clockify tags")
+
+            self._tagIdsByName = indexBy(self.tags, "name")
+            self._tagNamesById = indexBy(self.tags, "id", "name")
             self._syncTags = False
 
-            self.logger.info("Finished getting clockify tags, saving results to clockify_tags.json")
-            f = open("clockify_tags.json", "w")
-            f.write(json.dumps(self.tags, indent=2))
-            f.close()
-
             self._loadUser(curUser)
         return self.tags
 
@@ -605,6 +991,7 @@ class ClockifyAPI:
         rv = self._request(url, body=params, typ="POST")
         if rv.status_code == 201:
             self._syncTags = True
+            self._invalidateCached(wsId, "tags")
             rv = RetVal.OK
         elif rv.status_code == 400:
             rv = RetVal.EXISTS
@@ -616,21 +1003,21 @@ class ClockifyAPI:
         return rv
 
     def getTagName(self, tagID, workspace):
-        tName = None
-        tags = self.getTags(workspace)
-        for t in tags:
-            if t["id"] == tagID:
-                tName = t["name"]
+        self.getTags(workspace)
+        tName = self._tagNamesById.get(tagID)
+        if tName == None and self._refreshCached("tags", workspace):
+            self.getTags(workspace)
+            tName = self._tagNamesById.get(tagID)
         if tName == None:
             raise RuntimeError("TagID %s not found in workspace %s" % (tagID, workspace))
         return tName
 
     def getTagID(self, tagName, workspace):
-        tId = None
-        tags = self.getTags(workspace)
-        for t in tags:
-            if t["name"] == tagName:
-                tId = t["id"]
+        self.getTags(workspace)
+        tId = self._tagIdsByName.get(tagName)
+        if tId == None and self._refreshCached("tags", workspace):
+            self.getTags(workspace)
+            tId = self._tagIdsByName.get(tagName)
         if tId == None:
             raise RuntimeError("Tag %s not found in workspace %s" % (tagName, workspace))
         return tId
@@ -648,7 +1035,8 @@ class ClockifyAPI:
         }
         rv = self._request(url, body=params, typ="POST")
         if rv.status_code == 201:
-            self._syncTasks = True
+            with self._tasksLock:
+                self._tasks.pop(projectId, None)
             rv = RetVal.OK
         elif rv.status_code == 400:
             rv = RetVal.EXISTS
@@ -661,6 +1049,8 @@ class ClockifyAPI:
 
     def addEntry(self, start, description, projectName, userMail, workspace,
                  timeZone="Z", end=None, billable=False, tagNames=None, taskName=None):
+        """Adds the time entry unless the user already has the same one. Returns the RetVal and the
+        created entry (OK) or the existing one (EXISTS) as TimeEntry."""
         rv = self._loadUser(userMail)
         data = None
 
@@ -669,10 +1059,9 @@ class ClockifyAPI:
             url = self.url + "/workspaces/%s/time-entries" % wsId
 
             if projectName != None:
-                projectId = self.getProjectID(projectName, workspace, skipPrjQuery=self._syncProjects)
+                projectId = self.getProjectID(projectName, workspace)
                 if taskName != None:
-                    pTasks = self.getTasksOnProject(workspace, projectName)
-                    taskId = self.getTaskIdFromTasks(taskName, pTasks)
+                    taskId = self.getTaskID(taskName, projectId, workspace)
                     self.logger.info("Found task %s in project %s" % (taskName, projectName))
                 else:
                     taskId = None
@@ -680,10 +1069,14 @@ class ClockifyAPI:
                 taskId = None
                 self.logger.info("no project in entry %s" % description)
 
-            startTime = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+            # the duplicate check compares epoch seconds, the entries from Toggl already come as such
+            startEpoch = toEpoch(start)
+            endEpoch = toEpoch(end) if end != None else None
+            startTime = clockifyTime(start)
+            end_plus = None
             if end != None:
-                end_plus = (end + datetime.timedelta(hours=3)).strftime('%Y-%m-%dT%H:%M:%SZ')
-                end = end.strftime('%Y-%m-%dT%H:%M:%SZ')
+                end_plus = end
+                end = clockifyTime(end)
 
             params = {
                 "start": startTime,
@@ -704,62 +1097,140 @@ class ClockifyAPI:
                     tagIDs.append(tid)
                 params["tagIds"] = tagIDs
 
-            rv, entr = self.getTimeEntryForUser(userMail, workspace, description, projectName,
-                                                start, timeZone=timeZone, end=end_plus)
+            wanted = TimeEntry(None, startEpoch, endEpoch, description, params.get("projectId"),
+                               internTags(params.get("tagIds", ())), billable, self.userID)
+            index = self._prefetchedEntries(wanted.start)
+            if index != None:
+                rv = RetVal.OK
+                with self._entryIndexLock:
+                    entr = [d for d in index.get(wanted.key(), [])
+                            if entryMatches(wanted, d, compareTags=tagNames != None)]
+                    if entr == []:
+                        # filed as pending before the POST, a worker adding the same entry meanwhile finds it
+                        addToEntryIndex(index, wanted)
+            else:
+                if end_plus != None:
+                    end_plus = shiftClockifyTime(end_plus, datetime.timedelta(hours=3))
+                rv, entr = self.getTimeEntryForUser(userMail, workspace, description, projectName,
+                                                    start, timeZone=timeZone, end=end_plus)
+                if rv == RetVal.OK:
+                    entr = [d for d in map(TimeEntry.fromClockify, entr)
+                            if entryMatches(wanted, d, compareTags=tagNames != None)]
 
             if rv == RetVal.OK:
-                if entr != []:
-                    # filter data
-                    filteredData = []
-                    for d in entr:
-                        anyDiff = False
-                        if params["start"] != d['timeInterval']["start"]:
-                            anyDiff = True
-                        #                            self.logger.info("entry diff @start: %s %s"%(str(params["start"]), str(d['timeInterval']["start"])))
-                        if params["end"] != d['timeInterval']["end"]:
-                            anyDiff = True
-                        if 'projectId' in params:
-                            if params["projectId"] != d['projectId']:
-                                anyDiff = True
-                        #                                self.logger.info("entry diff @projectID: %s %s"%(str(params["projectId"]), str(d['projectId'])))
-                        if params["description"] != d["description"]:
-                            anyDiff = True
-                        #                            self.logger.info("entry diff @desc: %s %s"%(str(params["description"]), str(d['description'])))
-                        if self.userID != d["userId"]:
-                            anyDiff = True
-                        #                            self.logger.info("entry diff @userID: %s %s"%(str(self.userID), str(d['userId'])))
-                        if tagNames != None:
-                            tagIdsRcv = d["tagIds"]
-                            tagIdsRcv = tagIdsRcv if tagIdsRcv != None else []
-                            tagNamesRcv = []
-                            for tagID in tagIdsRcv:
-                                tagNamesRcv.append(self.getTagName(tagID, workspace))
-                            if set(tagNames) != set(tagNamesRcv):
-                                #                                self.logger.info("entry diff @tagNames: %s %s"%(str(set(tagNames)), str(set(tagNamesRcv))))
-                                anyDiff = True
-
-                        if anyDiff == False:
-                            filteredData.append(d)
-                    entr = filteredData
-
                 if entr == []:
-                    rv = self._request(url, body=params, typ="POST")
-                    self.logger.info("Adding entry: %s" % (json.dumps(params, indent=2)))
-
+                    try:
+                        rv = self._request(url, body=params, typ="POST")
+                        self.logger.info("Adding entry: %s" % (json.dumps(params, indent=2)))
+                        if rv.ok:
+                            data = rv.json()
+                    finally:
+                        if index != None:
+                            with self._entryIndexLock:
+                                discardFromEntryIndex(index, wanted)
+                                if data != None:
+                                    addToEntryIndex(index, TimeEntry.fromClockify(data))
                     if rv.ok:
-                        data = rv.json()
+                        data = TimeEntry.fromClockify(data)
                         rv = RetVal.OK
                     else:
                         self.logger.warning(
                             "Error adding time entrs, status code=%d, msg=%s" % (rv.status_code, rv.text))
                         rv = RetVal.ERR
                 else:
+                    data = entr[0]
                     rv = RetVal.EXISTS
             else:
                 rv = RetVal.ERR
 
         return rv, data
 
+    def removeEntry(self, start, description, projectName, userMail, workspace, end=None, tagNames=None):
+        """Deletes the entries of the user matching what addEntry would have created for the same
+        arguments. Returns the RetVal and the number of deleted entries."""
+        rv = self._loadUser(userMail)
+        if rv != RetVal.OK:
+            return rv, 0
+
+        end_plus = None
+        projectId = None
+        if projectName != None:
+            projectId = self.getProjectID(projectName, workspace)
+        if end != None:
+            end_plus = shiftClockifyTime(end, datetime.timedelta(hours=3))
+        tagIds = internTags(self.getTagID(tag, workspace) for tag in tagNames) if tagNames != None else None
+        wanted = TimeEntry(None, toEpoch(start), toEpoch(end) if end != None else None,
+                           description, projectId, tagIds, userId=self.userID)
+
+        index = self._prefetchedEntries(wanted.start)
+        if index != None:
+            with self._entryIndexLock:
+                entr = list(index.get(wanted.key(), []))
+        else:
+            rv, entr = self.getTimeEntryForUser(userMail, workspace, description, projectName, start, end=end_plus)
+            if rv != RetVal.OK:
+                return rv, 0
+            entr = [TimeEntry.fromClockify(d) for d in entr]
+
+        numDeleted = 0
+        for d in [d for d in entr if entryMatches(wanted, d, compareTags=tagNames != None)]:
+            rv = self.deleteEntry(d.id, workspace)
+            if rv != RetVal.OK and rv != RetVal.NOT_FOUND:
+                return rv, numDeleted
+            if index != None:
+                with self._entryIndexLock:
+                    discardFromEntryIndex(index, d)
+            if rv == RetVal.OK:
+                self.logger.info("Deleted entry %s: %s %s" % (d.id, clockifyTime(start), description))
+                numDeleted += 1
+        return RetVal.OK, numDeleted
+
+    def prefetchTimeEntries(self, userMail, workspace, start, end):
+        """Loads all entries of the user starting between start and end with one paginated query.
+
+        While the index is loaded, addEntry checks for duplicates of entries in that window in memory
+        instead of querying the API before every POST.
+        """
+        rv = self._loadUser(userMail)
+        if rv != RetVal.OK:
+            return rv
+
+        wsId = self.getWorkspaceID(workspace)
+        url = self.url + "/workspaces/%s/user/%s/time-entries" % (wsId, self.userID)
+        window = (toEpoch(start), toEpoch(end))
+        start = clockifyTime(start)
+        end = clockifyTime(end)
+
+        index = {}
+        numEntries = 0
+        for d in self.multiGetIter(url, params={"start": start, "end": end}):
+            # only the compared fields are kept, see TimeEntry
+            addToEntryIndex(index, TimeEntry.fromClockify(d))
+            numEntries += 1
+        self._entryIndex[self.userID] = window + (index,)
+        self.logger.info("prefetched %d clockify entries of user %s between %s and %s" % (
+            numEntries, userMail, start, end))
+        return RetVal.OK
+
+    def prefetchedTimeEntries(self, userMail):
+        """The entries (TimeEntry) of the user loaded by prefetchTimeEntries, kept up to date by the writes
+        since."""
+        context = self._contexts.get(userMail.lower())
+        window = self._entryIndex.get(context.userID) if context != None else None
+        if window == None:
+            return []
+        with self._entryIndexLock:
+            return [entry for entries in window[2].values() for entry in entries if entry.id != None]
+
+    def _prefetchedEntries(self, start):
+        window = self._entryIndex.get(self.userID)
+        if window == None:
+            return None
+        winStart, winEnd, index = window
+        if start < winStart or start >= winEnd:
+            return None
+        return index
+
     def getTimeEntryForUser(self, userMail, workspace, description,
                             projectName, start, timeZone="Z", end=None):
         data = None
@@ -772,7 +1243,7 @@ class ClockifyAPI:
             if projectName != None:
                 prjID = self.getProjectID(projectName, workspace)
             if start != None:
-                start = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+                start = clockifyTime(start)
 
             url = self.url + "/workspaces/%s/user/%s/time-entries" % (wsId, uId)
             params = {"description": description}
@@ -807,27 +1278,147 @@ class ClockifyAPI:
 
         return rv
 
-    def deleteEntriesOfUser(self, userMail, workspace, start=None):
-        while True:
-            rv, entries = self.getTimeEntryForUser(userMail, workspace, "", None, start, "")
-            numEntries = 0
-            if rv == RetVal.OK:
-                curUser = self._loadedUserEmail
-                rv = self._loadAdmin()
-                if rv == RetVal.OK:
-                    numEntries = len(entries)
-                    idx = 0
-                    for e in entries:
-                        msg = "deleting entry %d of %d" % (idx + 1, numEntries)
-                        self.logger.info(msg)
-                        rv = self.deleteEntry(e["id"], workspace)
-                        if rv == RetVal.OK:
-                            self.logger.info("...ok")
-                        idx += 1
-                self._loadUser(curUser)
-            if numEntries == 0:
-                break
-        return numEntries
+    def deleteEntriesOfUser(self, userMail, workspace, start=None, end=None, workers=4, batchSize=50):
+        """Deletes all entries of the user starting between start and end (both optional).
+
+        The entry IDs are collected with one paginated query, then deleted by the admin in batches
+        through the bulk delete endpoint, `workers` batches at a time. Returns the number of deleted
+        entries and the list of entry IDs which could not be deleted.
+        """
+        curUser = self._loadedUserEmail
+        rv = self._loadUser(userMail)
+        if rv != RetVal.OK:
+            return 0, []
+
+        wsId = self.getWorkspaceID(workspace)
+        userId = self.userID
+        url = self.url + "/workspaces/%s/user/%s/time-entries" % (wsId, userId)
+        params = {}
+        if start != None:
+            params["start"] = clockifyTime(start)
+        if end != None:
+            params["end"] = clockifyTime(end)
+        entryIds = [e["id"] for e in self.multiGetIter(url, params=params)]
+        self._loadUser(curUser)
+        self._entryIndex.pop(userId, None)
+
+        self.logger.info("deleting %d entries of user %s" % (len(entryIds), userMail))
+        numDeleted, failed = self._deleteEntriesById(wsId, userId, entryIds, workers, batchSize)
+        self.logger.info("deleted %d entries of user %s, %d failed" % (numDeleted, userMail, len(failed)))
+        return numDeleted, failed
+
+    def _deleteEntriesById(self, wsId, userId, entryIds, workers=4, batchSize=50):
+        token = self._userToken(self._adminEmail)
+        url = self.url + "/workspaces/%s/user/%s/time-entries" % (wsId, userId)
+        batches = [entryIds[i:i + batchSize] for i in range(0, len(entryIds), batchSize)]
+
+        def deleteOne(entryId):
+            rv = self._send("DELETE", self.url + "/workspaces/%s/time-entries/%s" % (wsId, entryId), token=token)
+            if not rv.ok:
+                self.logger.warning("Error deleteEntry %s, status code=%d, msg=%s" % (entryId, rv.status_code, rv.reason))
+            return rv.ok
+
+        def deleteBatch(batch):
+            rv = self._send("DELETE", url, params={"time-entry-ids": batch}, token=token)
+            if rv.ok:
+                # the entries which were deleted are returned, the others (of another user, already
+                # gone) are silently skipped
+                try:
+                    deleted = {e["id"] for e in rv.json()}
+                except (ValueError, TypeError, KeyError):
+                    self.logger.warning("Unexpected answer to bulk delete, msg=%s" % rv.text)
+                    return list(batch)
+                missing = [entryId for entryId in batch if entryId not in deleted]
+                if missing:
+                    self.logger.warning("Bulk delete did not delete the entries %s" % ", ".join(missing))
+                return missing
+            # bulk delete refused, fall back to deleting the entries of the batch one by one
+            self.logger.info("bulk delete failed with status code %d, deleting one by one" % rv.status_code)
+            return [entryId for entryId in batch if not deleteOne(entryId)]
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batchFailed in pool.map(deleteBatch, batches):
+                failed.extend(batchFailed)
+        return len(entryIds) - len(failed), failed
+
+    def getTimeEntry(self, entryId, userMail, workspace):
+        """Returns the RetVal and the time entry of the user with the given ID as TimeEntry, NOT_FOUND if
+        there is none."""
+        rv = self._loadUser(userMail)
+        if rv != RetVal.OK:
+            return rv, None
+        url = self.url + "/workspaces/%s/time-entries/%s" % (self.getWorkspaceID(workspace), entryId)
+        rv = self._request(url)
+        if rv.ok:
+            return RetVal.OK, TimeEntry.fromClockify(rv.json())
+        if rv.status_code == 404:
+            return RetVal.NOT_FOUND, None
+        self.logger.warning("Error getTimeEntry, status code=%d, msg=%s" % (rv.status_code, rv.text))
+        return RetVal.ERR, None
+
+    def updateEntry(self, entryId, start, description, projectName, userMail, workspace,
+                    end=None, billable=False, tagNames=None, taskName=None, current=None):
+        """Replaces the time entry with the given ID by the entry addEntry would create for the same
+        arguments. When the entry as it is now is given in `current` (TimeEntry), its tags and, within
+        the same project, its task are kept unless tagNames or taskName are given. Returns the RetVal
+        (NOT_FOUND if the entry was deleted) and the updated entry."""
+        rv = self._loadUser(userMail)
+        if rv != RetVal.OK:
+            return rv, None
+
+        wsId = self.getWorkspaceID(workspace)
+        params = {
+            "start": clockifyTime(start),
+            "billable": billable,
+            "description": description
+        }
+        if projectName != None:
+            params["projectId"] = self.getProjectID(projectName, workspace)
+            if taskName != None:
+                params["taskId"] = self.getTaskID(taskName, params["projectId"], workspace)
+        if end != None:
+            params["end"] = clockifyTime(end)
+        if tagNames != None:
+            params["tagIds"] = [self.getTagID(tag, workspace) for tag in tagNames]
+        if current != None:
+            # the PUT replaces the whole entry, what is not written here would be cleared
+            if tagNames == None and current.tags:
+                params["tagIds"] = sorted(current.tags)
+            if taskName == None and current.taskId != None and params.get("projectId") == current.project:
+                params["taskId"] = current.taskId
+
+        url = self.url + "/workspaces/%s/time-entries/%s" % (wsId, entryId)
+        rv = self._request(url, body=params, typ="PUT")
+        self.logger.info("Updating entry %s: %s" % (entryId, json.dumps(params, indent=2)))
+        if rv.status_code == 404:
+            self.logger.warning("Time entry %s to update does not exist anymore" % entryId)
+            return RetVal.NOT_FOUND, None
+        if not rv.ok:
+            self.logger.warning("Error updating time entry, status code=%d, msg=%s" % (rv.status_code, rv.text))
+            return RetVal.ERR, None
+
+        entry = TimeEntry.fromClockify(rv.json())
+        window = self._entryIndex.get(self.userID)
+        if window != None:
+            with self._entryIndexLock:
+                # the entry as it was is filed under its old key, no need to look anywhere else
+                removeFromEntryIndex(window[2], {entryId}, current.key() if current != None else None)
+                if self._prefetchedEntries(entry.start) != None:
+                    addToEntryIndex(window[2], entry)
+        return RetVal.OK, entry
+
+    def deleteEntriesById(self, userMail, workspace, entryIds, workers=4, batchSize=50):
+        """Deletes the given time entries of the user in batches, see deleteEntriesOfUser. Returns the
+        number of deleted entries and the list of entry IDs which could not be deleted."""
+        userId = self._contexts[userMail.lower()].userID
+        wsId = self.getWorkspaceID(workspace)
+        numDeleted, failed = self._deleteEntriesById(wsId, userId, list(entryIds), workers, batchSize)
+        window = self._entryIndex.get(userId)
+        if window != None:
+            with self._entryIndexLock:
+                removeFromEntryIndex(window[2], set(entryIds) - set(failed))
+        return numDeleted, failed
 
     def deleteEntry(self, entryID, workspace):
         wsId = self.getWorkspaceID(workspace)
@@ -835,6 +1426,8 @@ class ClockifyAPI:
         rv = self._request(url, typ="DELETE")
         if rv.ok:
             return RetVal.OK
+        elif rv.status_code == 404:
+            return RetVal.NOT_FOUND
         else:
             self.logger.warning("Error deleteEntry, status code=%d, msg=%s" % (rv.status_code, rv.reason))
             return RetVal.ERR
@@ -846,59 +1439,79 @@ class ClockifyAPI:
         rv = self._request(url, typ="DELETE")
         if rv.ok:
             self._syncProjects = True
+            self._invalidateCached(wsId, "projects")
             return RetVal.OK
         else:
             self.logger.warning("Error deleteProject, status code=%d, msg=%s" % (rv.status_code, rv.reason))
             return RetVal.ERR
 
-    def deleteAllProjects(self, workspace):
-        curUser = self._loadedUserEmail
-        for user in self._APIusers:
-            self._loadUser(user["email"])
-            self.logger.info("Deleting all project from user %s" % user["email"])
-            prjs = self.getProjects(workspace)
-            idx = 0
-            numProjects = len(prjs)
-            for p in prjs:
-                msg = "deleting project %s (%d of %d)" % (p["name"], idx + 1, numProjects)
-                self.logger.info(msg)
-                self.deleteProject(p["name"], workspace, skipPrjQuery=True)
-                idx += 1
-        self._loadUser(curUser)
+    def _deleteByIds(self, wsId, kind, ids, workers=4):
+        """Deletes the workspace objects of the kind (projects, clients) by ID as the admin, `workers`
+        requests at a time. Returns the IDs which could not be deleted."""
+        token = self._userToken(self._adminEmail)
 
-    def wipeOutWorkspace(self, workspace):
-        curUser = self._loadedUserEmail
+        def deleteOne(objId):
+            rv = self._send("DELETE", self.url + "/workspaces/%s/%s/%s" % (wsId, kind, objId), token=token)
+            if not rv.ok:
+                self.logger.warning("Error deleting %s %s, status code=%d, msg=%s" % (kind, objId, rv.status_code, rv.reason))
+            return rv.ok
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(deleteOne, ids))
+        return [objId for objId, ok in zip(ids, results) if not ok]
+
+    def deleteAllProjects(self, workspace, workers=4):
+        wsId = self.getWorkspaceID(workspace)
+        # list what is really there, not what the metadata cache remembers
+        self._invalidateCached(wsId, "projects")
+        self._syncProjects = True
+        prjIds = list(dict.fromkeys(p["id"] for p in self.getProjects(workspace)))
+        self.logger.info("deleting %d projects" % len(prjIds))
+        failed = self._deleteByIds(wsId, "projects", prjIds, workers)
+        self._syncProjects = True
+        self._invalidateCached(wsId, "projects")
+        return len(prjIds) - len(failed), failed
+
+    def wipeOutWorkspace(self, workspace, workers=4):
+        """Deletes all entries, projects and clients of the workspace, in this order since entries
+        reference projects and projects reference clients."""
+        rv = RetVal.OK
+        self._ensureUsers()
         for user in self._APIusers:
             self.logger.info("Deleting all entries from user %s" % user["email"])
-            self.deleteEntriesOfUser(user["email"], workspace)
+            _, failed = self.deleteEntriesOfUser(user["email"], workspace, workers=workers)
+            if failed:
+                rv = RetVal.ERR
 
-        self.deleteAllProjects(workspace)
-        self.deleteAllClients(workspace)
-        self._loadUser(curUser)
+        _, failed = self.deleteAllProjects(workspace, workers)
+        if failed:
+            rv = RetVal.ERR
+        _, failed = self.deleteAllClients(workspace, workers)
+        if failed:
+            rv = RetVal.ERR
+        return rv
 
     def deleteClient(self, clientName, workspace, skipCliQuery=False):
         wsId = self.getWorkspaceID(workspace)
         clId = self.getClientID(clientName, workspace, skipCliQuery)
-        url = "https://api.clockify.me/api/workspaces/%s/clients/%s" % (wsId, clId)
+        url = self.url + "/workspaces/%s/clients/%s" % (wsId, clId)
         rv = self._request(url, typ="DELETE")
         if rv.ok:
             self._syncClients = True
+            self._invalidateCached(wsId, "clients")
             return RetVal.OK
         else:
             self.logger.warning("Error deleteClient, status code=%d, msg=%s" % (rv.status_code, rv.reason))
             return RetVal.ERR
 
-    def deleteAllClients(self, workspace):
-        curUser = self._loadedUserEmail
-        for user in self._APIusers:
-            self._loadUser(user["email"])
-            self.logger.info("Deleting all clients from user %s" % user["email"])
-            clis = self.getClients(workspace)
-            idx = 0
-            numClients = len(clis)
-            for c in clis:
-                msg = "deleting client %s (%d of %d)" % (c["name"], idx + 1, numClients)
-                self.logger.info(msg)
-                self.deleteClient(c["name"], workspace, skipCliQuery=True)
-                idx += 1
-        self._loadUser(curUser)
+    def deleteAllClients(self, workspace, workers=4):
+        wsId = self.getWorkspaceID(workspace)
+        # list what is really there, not what the metadata cache remembers
+        self._invalidateCached(wsId, "clients")
+        self._syncClients = True
+        cliIds = [c["id"] for c in self.getClients(workspace)]
+        self.logger.info("deleting %d clients" % len(cliIds))
+        failed = self._deleteByIds(wsId, "clients", cliIds, workers)
+        self._syncClients = True
+        self._invalidateCached(wsId, "clients")
+        return len(cliIds) - len(failed), failed
@@ -0,0 +1,64 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class MetadataCache:
+    """Compact JSON store of clockify metadata (projects, clients, tags, ...) keyed by workspace ID.
+
+    Entries expire `ttl` seconds after they were fetched. ClockifyAPI invalidates an entry whenever
+    it changes the matching objects itself, so a warm start only reuses data nobody touched since.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path="clockify_cache.json", ttl=3600):
+        self.logger = logging.getLogger('clockify-automation')
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = self._read()
+
+    def _empty(self):
+        return {"version": self.VERSION, "workspaces": {}}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self._empty()
+        except (OSError, ValueError) as e:
+            self.logger.warning("ignoring unreadable metadata cache %s: %s" % (self.path, str(e)))
+            return self._empty()
+        if data.get("version") != self.VERSION:
+            self.logger.info("metadata cache %s has an old format, starting with an empty one" % self.path)
+            return self._empty()
+        return data
+
+    def _write(self):
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self._data, f, separators=(",", ":"))
+        os.replace(tmpPath, self.path)
+
+    def get(self, workspaceId, kind):
+        with self._lock:
+            entry = self._data["workspaces"].get(workspaceId, {}).get(kind)
+            if entry == None or time.time() - entry["fetched"] > self.ttl:
+                return None
+            return entry["data"]
+
+    def put(self, workspaceId, kind, data):
+        with self._lock:
+            workspace = self._data["workspaces"].setdefault(workspaceId, {})
+            workspace[kind] = {"fetched": time.time(), "data": data}
+            self._write()
+
+    def invalidate(self, workspaceId, kind):
+        with self._lock:
+            workspace = self._data["workspaces"].get(workspaceId, {})
+            if workspace.pop(kind, None) != None:
+                self._write()
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+# upper bounds of the request latency histogram in seconds, the last bucket (+Inf) catches the rest
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# path segments naming a collection, the segment following one of them is an object ID
+_COLLECTIONS = {"workspaces", "workspace", "user", "users", "projects", "clients", "tags", "tasks",
+                "time-entries", "time_entries", "userGroups", "team", "me", "search", "archive"}
+
+
+def endpointName(url):
+    """Path of the URL with the object IDs replaced by {id}, e.g. /api/v1/workspaces/{id}/time-entries."""
+    segments = urlsplit(url).path.rstrip("/").split("/")
+    for idx in range(1, len(segments)):
+        if segments[idx - 1] in _COLLECTIONS and segments[idx] not in _COLLECTIONS:
+            segments[idx] = "{id}"
+    return "/".join(segments)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.statusCodes = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = 0.0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+
+    def add(self, status, seconds, bytesSent, bytesReceived):
+        self.count += 1
+        self.statusCodes[status] = self.statusCodes.get(status, 0) + 1
+        idx = 0
+        while idx < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[idx]:
+            idx += 1
+        self.buckets[idx] += 1
+        self.seconds += seconds
+        self.bytesSent += bytesSent
+        self.bytesReceived += bytesReceived
+
+    def asDict(self):
+        return {
+            "requests": self.count,
+            "statusCodes": {str(code): count for code, count in sorted(self.statusCodes.items())},
+            "seconds": round(self.seconds, 6),
+            "latencyBuckets": {str(le): count for le, count in zip(LATENCY_BUCKETS + ("+Inf",), self.buckets)},
+            "bytesSent": self.bytesSent,
+            "bytesReceived": self.bytesReceived,
+        }
+
+
+class HttpMetrics:
+    """Request counts, status codes, latencies and bytes per service and endpoint, plus the time spent
+    waiting for the rate limiters. Shared by all clients of the process, see getMetrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._sleeps = {}
+
+    def record(self, service, method, url, status, seconds, bytesSent=0, bytesReceived=0):
+        key = (service, method, endpointName(url))
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats == None:
+                stats = EndpointStats()
+                self._endpoints[key] = stats
+            stats.add(status, seconds, bytesSent, bytesReceived)
+
+    def recordSleep(self, service, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            count, total = self._sleeps.get(service, (0, 0.0))
+            self._sleeps[service] = (count + 1, total + seconds)
+
+    def summary(self):
+        with self._lock:
+            endpoints = [dict(service=service, method=method, endpoint=endpoint, **stats.asDict())
+                         for (service, method, endpoint), stats in sorted(self._endpoints.items())]
+            sleeps = {service: {"sleeps": count, "seconds": round(total, 6)}
+                      for service, (count, total) in sorted(self._sleeps.items())}
+        return {
+            "requests": sum(e["requests"] for e in endpoints),
+            "bytesSent": sum(e["bytesSent"] for e in endpoints),
+            "bytesReceived": sum(e["bytesReceived"] for e in endpoints),
+            "endpoints": endpoints,
+            "rateLimitSleep": sleeps,
+        }
+
+    def writeJson(self, path, run=None):
+        """Writes the summary, with the `run` details (duration, results, ...) next to it."""
+        data = {"run": run or {}, "http": self.summary()}
+        _writeAtomic(path, json.dumps(data, indent=2))
+
+    def writePrometheus(self, path, run=None, prefix="clockify_sync"):
+        """Writes the metrics in the Prometheus text format for the node exporter textfile collector.
+        Numeric values of `run` become gauges named after their key."""
+        lines = []
+
+        def metric(name, typ, helpText, samples):
+            lines.append("# HELP %s_%s %s" % (prefix, name, helpText))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, typ))
+            for labels, value in samples:
+                lines.append("%s_%s%s %s" % (prefix, name, _labels(labels), _number(value)))
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            sleeps = sorted(self._sleeps.items())
+
+        base = [((("service", s), ("method", m), ("endpoint", e)), stats) for (s, m, e), stats in endpoints]
+        metric("http_requests_total", "counter", "HTTP requests by endpoint and status code.",
+               [(labels + (("code", code),), count)
+                for labels, stats in base for code, count in sorted(stats.statusCodes.items())])
+        histogram = []
+        for labels, stats in base:
+            cumulative = 0
+            for le, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.buckets):
+                cumulative += count
+                histogram.append((labels + (("le", le),), cumulative))
+        lines.append("# HELP %s_http_request_duration_seconds Latency of the HTTP requests." % prefix)
+        lines.append("# TYPE %s_http_request_duration_seconds histogram" % prefix)
+        for labels, value in histogram:
+            lines.append("%s_http_request_duration_seconds_bucket%s %s" % (prefix, _labels(labels), value))
+        for labels, stats in base:
+            lines.append("%s_http_request_duration_seconds_sum%s %s" % (prefix, _labels(labels), _number(stats.seconds)))
+            lines.append("%s_http_request_duration_seconds_count%s %s" % (prefix, _labels(labels), stats.count))
+        metric("http_sent_bytes_total", "counter", "Bytes of the request bodies.",
+               [(labels, stats.bytesSent) for labels, stats in base])
+        metric("http_received_bytes_total", "counter", "Bytes of the response bodies.",
+               [(labels, stats.bytesReceived) for labels, stats in base])
+        metric("rate_limit_sleep_seconds_total", "counter", "Time spent waiting for the rate limiters.",
+               [((("service", service),), total) for service, (_, total) in sleeps])
+        for key, value in sorted((run or {}).items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric(key, "gauge", "Value of the last sync run.", [((), value)])
+            elif isinstance(value, dict) and all(isinstance(v, (int, float)) for v in value.values()):
+                metric(key, "gauge", "Value of the last sync run.",
+                       [((("name", name),), v) for name, v in sorted(value.items())])
+        _writeAtomic(path, "\n".join(lines) + "\n")
+
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                             for key, value in labels)
+
+
+def _writeAtomic(path, text):
+    # the textfile collector must never read a half written file
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmpPath, "w") as f:
+        f.write(text)
+    os.replace(tmpPath, path)
+
+
+_metrics = HttpMetrics()
+
+
+def getMetrics():
+    return _metrics
@@ -0,0 +1,121 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, List
+
+from Metrics import getMetrics
+
+logger = logging.getLogger('clockify-automation')
+
+
+class _ThreadProfiles:
+    """Starts a cProfile profiler in every thread created while profiling, so the pipeline stages and
+    the page fetchers are covered as well as the main thread. Since Python 3.12 the profiler of the
+    main thread sees every thread by itself."""
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _start_thread(self, frame, event, arg):
+        # the hook only has to start the profiler, it is replaced by it or removed
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # a single profiler already sees every thread where profiling is interpreter wide
+            return
+        with self._lock:
+            self.profiles.append(profile)
+
+    def start(self) -> cProfile.Profile:
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread)
+        main = cProfile.Profile()
+        main.enable()
+        self.profiles.append(main)
+        return main
+
+    def stop(self) -> pstats.Stats:
+        threading.setprofile(None)
+        with self._lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            try:
+                stats.add(profile)
+            except TypeError:
+                # the thread never ran any Python code after the profiler started
+                pass
+        return stats
+
+
+def _stats_text(stats: pstats.Stats, sort: str, limit: int) -> str:
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def run_profiled(func: Callable[[], None], report_path: str, limit: int = 30, frames: int = 5):
+    """Runs func under cProfile (all threads) and tracemalloc and writes a text report.
+
+    The report splits the wall time into CPU time, time waiting for HTTP responses and time sleeping
+    in the rate limiters (the latter two summed over all threads, as measured by Metrics), lists the
+    hotspots by cumulative and own time and the top allocation sites. The raw profile is stored next
+    to the report with a .pstats suffix for tools like snakeviz.
+    """
+    profiles = _ThreadProfiles()
+    tracemalloc.start(frames)
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    profiles.start()
+    try:
+        func()
+    finally:
+        stats = profiles.stop()
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        http = getMetrics().summary()
+        network = sum(endpoint['seconds'] for endpoint in http['endpoints'])
+        sleeps = sum(service['seconds'] for service in http['rateLimitSleep'].values())
+
+        lines = [
+            'Time',
+            f'  wall time:             {wall:10.3f}s',
+            f'  CPU time:              {cpu:10.3f}s  (all threads)',
+            f'  waiting for HTTP:      {network:10.3f}s  ({http["requests"]} requests, summed over threads)',
+            f'  rate limit sleeps:     {sleeps:10.3f}s  (summed over threads)',
+            '',
+            'Memory',
+            f'  peak traced:           {peak / 1024 / 1024:10.2f} MiB',
+            '',
+            f'Top {limit} functions by cumulative time',
+            _stats_text(stats, 'cumulative', limit),
+            f'Top {limit} functions by own time',
+            _stats_text(stats, 'tottime', limit),
+            f'Top {limit} allocation sites (live at the end of the run)',
+        ]
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>')]
+        for stat in snapshot.filter_traces(filters).statistics('lineno')[:limit]:
+            frame = stat.traceback[0]
+            lines.append(f'  {stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}')
+
+        with open(report_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        stats.dump_stats(os.path.splitext(report_path)[0] + '.pstats')
+        logger.info(f'Profile written to {report_path} (wall {wall:.2f}s, CPU {cpu:.2f}s, '
+                    f'HTTP {network:.2f}s, rate limit sleeps {sleeps:.2f}s)')
@@ -0,0 +1,86 @@
+import datetime
+import email.utils
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket shared by all requests sent with one API token.
+
+    Requests flow at up to `rate` per second (with bursts of up to `capacity`). When the server
+    answers with 429 the rate is halved and every caller waits for the Retry-After period; the rate
+    then climbs back towards the configured limit with every successful request.
+    """
+
+    def __init__(self, rate, capacity=None, minRate=0.5):
+        self.maxRate = float(rate)
+        self.rate = float(rate)
+        self.minRate = min(minRate, self.maxRate)
+        self.capacity = float(capacity) if capacity != None else max(1.0, self.maxRate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._blockedUntil = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes one token and returns how many seconds the caller has to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = 0.0
+            if self._tokens < 0:
+                wait = -self._tokens / self.rate
+            return max(wait, self._blockedUntil - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def backoff(self, retryAfter=None):
+        """Server pushed back (429), slow down and block all callers. Returns the delay to wait."""
+        with self._lock:
+            self.rate = max(self.minRate, self.rate / 2)
+            delay = retryAfter if retryAfter != None else 1.0 / self.rate
+            self._blockedUntil = max(self._blockedUntil, time.monotonic() + delay)
+            return delay
+
+    def success(self):
+        with self._lock:
+            if self.rate < self.maxRate:
+                self.rate = min(self.maxRate, self.rate + 1.0)
+
+
+def retryAfterSeconds(headers):
+    """Parses a Retry-After header given either in seconds or as an HTTP date."""
+    value = headers.get("Retry-After")
+    if value == None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo == None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+_limiters = {}
+_limitersLock = threading.Lock()
+
+
+def getRateLimiter(key, rate, capacity=None):
+    """Returns the process wide limiter for `key` (usually service + API token), creating it on first use."""
+    with _limitersLock:
+        limiter = _limiters.get(key)
+        if limiter == None:
+            limiter = RateLimiter(rate, capacity)
+            _limiters[key] = limiter
+        return limiter
@@ -0,0 +1,141 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from ClockifyAPI import ClockifyAPI, RetVal
+from TimeConversion import clockifyTime
+from TimeEntry import TimeEntry
+
+logger = logging.getLogger('clockify-automation')
+
+
+@dataclass
+class ReconcilePlan:
+    """Writes bringing the Clockify entries of a range in line with Toggl.
+
+    `creates` and the second item of `updates` are Toggl entries, the first item of `updates` and
+    `deletes` are the Clockify entries they replace or remove. `failed` counts the Toggl entries which
+    could not be planned, e.g. because their project is missing in Clockify.
+    """
+    creates: List[TimeEntry] = field(default_factory=list)
+    updates: List[Tuple[TimeEntry, TimeEntry]] = field(default_factory=list)
+    deletes: List[TimeEntry] = field(default_factory=list)
+    unchanged: int = 0
+    failed: int = 0
+
+    def counts(self) -> dict:
+        return {'create': len(self.creates), 'update': len(self.updates), 'delete': len(self.deletes),
+                'unchanged': self.unchanged, 'failed': self.failed}
+
+
+def _desired_key(entry: TimeEntry, project_id: Callable[[str], Optional[str]]) -> tuple:
+    project = project_id(entry.project) if entry.project is not None else None
+    return entry.start, entry.end, entry.description, project, entry.billable
+
+
+def _existing_key(entry: TimeEntry) -> tuple:
+    return entry.start, entry.end, entry.description, entry.project, entry.billable
+
+
+def _pair_by(desired: List[Tuple[tuple, TimeEntry]], existing: List[TimeEntry], desired_field: Callable,
+             existing_field: Callable) -> Tuple[List[Tuple[TimeEntry, TimeEntry]], list, list]:
+    candidates: Dict[object, List[TimeEntry]] = {}
+    for entry in existing:
+        candidates.setdefault(existing_field(entry), []).append(entry)
+    pairs, unpaired = [], []
+    for key, entry in desired:
+        matching = candidates.get(desired_field(key))
+        if matching:
+            pairs.append((matching.pop(0), entry))
+        else:
+            unpaired.append((key, entry))
+    return pairs, unpaired, [entry for entries in candidates.values() for entry in entries]
+
+
+def plan_reconcile(desired: Iterable[TimeEntry], existing: Iterable[TimeEntry],
+                   project_id: Callable[[str], Optional[str]]) -> ReconcilePlan:
+    """Matches the wanted entries (read from Toggl) with the Clockify entries of the same range.
+
+    Identical entries are left alone. The rest is paired first by start time, then by description and
+    project, and every pair becomes one update instead of a delete and a create. What is left over on
+    the Toggl side is created, what is left over on the Clockify side is deleted. Toggl entries which
+    cannot be matched are logged and counted as failed, nothing is deleted then.
+    """
+    plan = ReconcilePlan()
+    remaining: Dict[tuple, List[TimeEntry]] = {}
+    for entry in existing:
+        remaining.setdefault(_existing_key(entry), []).append(entry)
+
+    unmatched = []
+    for entry in desired:
+        try:
+            key = _desired_key(entry, project_id)
+        except RuntimeError as e:
+            logger.error(f'Error while planning entry "{entry.description}" from {clockifyTime(entry.start)}: {str(e)}')
+            plan.failed += 1
+            continue
+        same = remaining.get(key)
+        if same:
+            same.pop()
+            plan.unchanged += 1
+        else:
+            unmatched.append((key, entry))
+    leftover = [entry for entries in remaining.values() for entry in entries]
+
+    by_start, unmatched, leftover = _pair_by(unmatched, leftover, lambda key: key[0],
+                                             lambda entry: entry.start)
+    by_content, unmatched, leftover = _pair_by(unmatched, leftover, lambda key: (key[2], key[3]),
+                                               lambda entry: (entry.description, entry.project))
+    plan.updates = by_start + by_content
+    plan.creates = [entry for _, entry in unmatched]
+    plan.deletes = leftover
+    if plan.failed and leftover:
+        # a Clockify entry left over may be the copy of a Toggl entry which failed, it has to stay
+        logger.warning(f'{plan.failed} Toggl entries could not be planned, keeping {len(leftover)} Clockify '
+                       f'entries which would have been deleted')
+        plan.deletes = []
+    return plan
+
+
+def _run_batches(func: Callable[[object], RetVal], items: list, batch_size: int, workers: int) -> List[RetVal]:
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for idx in range(0, len(items), batch_size):
+            results.extend(pool.map(func, items[idx:idx + batch_size]))
+    return results
+
+
+def apply_plan(clockify: ClockifyAPI, plan: ReconcilePlan, user_mail: str, workspace: str,
+               batch_size: int = 50, workers: int = 4) -> dict:
+    """Sends the creates, then the updates, then the deletes of the plan, `batch_size` writes at a
+    time spread over `workers` threads. Returns the number of failed writes per kind, and as `plan` the
+    number of entries which could not be planned."""
+    def create(entry: TimeEntry) -> RetVal:
+        try:
+            return clockify.addEntry(**entry.addEntryArgs(user_mail, workspace))[0]
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            logger.error(f'Error while creating entry "{entry.description}" from {clockifyTime(entry.start)}: {str(e)}')
+            return RetVal.ERR
+
+    def update(pair: Tuple[TimeEntry, TimeEntry]) -> RetVal:
+        current, entry = pair
+        try:
+            # Toggl tags are not synced, the tags and the task set in Clockify are kept
+            return clockify.updateEntry(current.id, **entry.addEntryArgs(user_mail, workspace), current=current)[0]
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            logger.error(f'Error while updating entry "{entry.description}" from {clockifyTime(entry.start)}: {str(e)}')
+            return RetVal.ERR
+
+    created = _run_batches(create, plan.creates, batch_size, workers)
+    updated = _run_batches(update, plan.updates, batch_size, workers)
+    _, failed = clockify.deleteEntriesById(user_mail, workspace, [entry.id for entry in plan.deletes],
+                                           workers=workers, batchSize=batch_size)
+    return {
+        'create': sum(1 for rv in created if rv not in (RetVal.OK, RetVal.EXISTS)),
+        'update': sum(1 for rv in updated if rv != RetVal.OK),
+        'delete': len(failed),
+        'plan': plan.failed,
+    }
@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger('clockify-automation')
+
+
+class SyncJournal:
+    """Append-only record of the Toggl entries a sync has already sent to Clockify.
+
+    The first line names the job (workspaces, user and range), every further line holds one Toggl entry
+    ID and its outcome. Lines are buffered and written with an fsync every `batch` entries, so a crash
+    loses at most the last batch; those entries are found again by the duplicate check. A resumed run
+    reads the journal of the same job and skips the entries recorded as done.
+    """
+
+    def __init__(self, path: str, job: str, batch: int = 50):
+        self.path = path
+        self.job = job
+        self.batch = batch
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self) -> Dict[int, str]:
+        """Outcome per Toggl entry ID recorded for this job, empty if the journal belongs to another job."""
+        done = {}
+        try:
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return done
+        if not lines:
+            return done
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            logger.warning(f'Ignoring unreadable journal {self.path}')
+            return done
+        if header.get('job') != self.job:
+            logger.info(f'Journal {self.path} belongs to another job, starting from scratch')
+            return done
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line may be cut short by the crash
+                continue
+            done[record['id']] = record['result']
+        return done
+
+    def open(self, resume: bool):
+        """Starts appending to the journal of this job, a run which does not resume starts a new one."""
+        keep = resume and self.load() != {}
+        self._file = open(self.path, 'a' if keep else 'w')
+        if not keep:
+            self._file.write(json.dumps({'job': self.job, 'started': int(time.time())}) + '\n')
+            self._sync()
+        return self
+
+    def record(self, toggl_id: int, result: str):
+        with self._lock:
+            self._buffer.append(json.dumps({'id': toggl_id, 'result': result}, separators=(',', ':')))
+            if len(self._buffer) >= self.batch:
+                self._flush()
+
+    def _flush(self):
+        if self._buffer and self._file is not None:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._buffer = []
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self, completed: bool = False):
+        """Writes what is buffered, a completed run removes the journal as there is nothing to resume."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            self._file.close()
+            self._file = None
+        if completed:
+            os.remove(self.path)
+
+
+def journal_job(toggl_workspace: str, clockify_workspace: str, email: str, from_date: str, to_date: str,
+                since: Optional[int] = None) -> str:
+    job = f'{toggl_workspace}/{clockify_workspace}/{email}/{from_date}..{to_date}'
+    return job if since is None else f'{job}/since={since}'
@@ -0,0 +1,163 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger('clockify-automation')
+
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        # time spent inside the stage function, summed over the workers, without waiting on the queues
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items_in: int, items_out: int, busy_seconds: float):
+        with self._lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_seconds += busy_seconds
+
+    def as_dict(self) -> dict:
+        return {'workers': self.workers, 'in': self.items_in, 'out': self.items_out,
+                'busy_seconds': round(self.busy_seconds, 3)}
+
+
+class SyncPipeline:
+    """Runs a source iterator through a chain of stages, each in its own thread(s).
+
+    Every stage function takes one item and returns an iterable of zero or more items for the next
+    stage. The stages are connected by bounded queues, so the first items reach the last stage while
+    the source is still producing and at most `maxsize` items wait between two stages. An exception
+    in any stage stops the whole pipeline and is re-raised by `run`.
+
+        pipeline = SyncPipeline(fetch_rows(), maxsize=100)
+        pipeline.add_stage('filter', keep_row)
+        pipeline.add_stage('upload', upload, workers=4)
+        for result in pipeline.run():
+            ...
+    """
+
+    def __init__(self, source: Iterable, maxsize: int = 100, source_name: str = 'fetch'):
+        self._source = source
+        self._maxsize = maxsize
+        self._stages = []
+        self._error = None
+        self._aborted = threading.Event()
+        self.stats = [StageStats(source_name, 1)]
+
+    def add_stage(self, name: str, func: Callable[[object], Optional[Iterable]], workers: int = 1):
+        self._stages.append((func, workers))
+        self.stats.append(StageStats(name, workers))
+        return self
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self._aborted.is_set():
+                    raise PipelineAborted()
+
+    def _get(self, q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._aborted.is_set():
+                    raise PipelineAborted()
+
+    def _fail(self, e: BaseException):
+        if self._error is None:
+            self._error = e
+        self._aborted.set()
+
+    def _run_source(self, out_q: queue.Queue, stats: StageStats):
+        try:
+            iterator = iter(self._source)
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    stats.add(0, 0, time.perf_counter() - started)
+                    break
+                stats.add(0, 1, time.perf_counter() - started)
+                self._put(out_q, item)
+            self._put(out_q, _DONE)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _run_stage(self, func, in_q: queue.Queue, out_q: queue.Queue, stats: StageStats, remaining: List[int],
+                   lock: threading.Lock):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _DONE:
+                    # let the other workers of this stage see the end as well, the last one forwards it
+                    self._put(in_q, _DONE)
+                    with lock:
+                        remaining[0] -= 1
+                        last = remaining[0] == 0
+                    if last:
+                        self._put(out_q, _DONE)
+                    return
+                started = time.perf_counter()
+                results = func(item)
+                results = list(results) if results is not None else []
+                stats.add(1, len(results), time.perf_counter() - started)
+                for result in results:
+                    self._put(out_q, result)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self) -> Iterator:
+        queues = [queue.Queue(maxsize=self._maxsize) for _ in range(len(self._stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0], self.stats[0]), daemon=True)]
+        for idx, (func, workers) in enumerate(self._stages):
+            remaining = [workers]
+            lock = threading.Lock()
+            for _ in range(workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage,
+                    args=(func, queues[idx], queues[idx + 1], self.stats[idx + 1], remaining, lock),
+                    daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE:
+                    break
+                yield item
+        except PipelineAborted:
+            pass
+        finally:
+            if self._error is None:
+                # the consumer stopped early, let the stages end
+                self._aborted.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def log_stats(self):
+        for stats in self.stats:
+            logger.info(f'stage {stats.name}: {stats.as_dict()}')
@@ -0,0 +1,64 @@
+import datetime
+import time
+
+CLOCKIFY_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def parseTogglTime(value):
+    """Parses a Toggl ISO 8601 timestamp into a naive datetime in UTC."""
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo != None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt.replace(microsecond=0)
+
+
+def _utcSeconds(value):
+    # seconds since the epoch of a YYYY-MM-DDTHH:MM:SS prefix in UTC, fromisoformat is the fastest parser
+    return int((datetime.datetime.fromisoformat(value[:19]) - _EPOCH).total_seconds())
+
+
+def togglEpoch(value):
+    """Converts a Toggl timestamp to integer seconds since the epoch.
+
+    Toggl sends UTC timestamps as 2021-01-01T10:00:00+00:00, those are read as they are. Anything else
+    (other offsets, fractions of a second) goes through a full parse normalizing it to UTC.
+    """
+    if len(value) == 25 and value[10] == 'T' and value.endswith('+00:00'):
+        return _utcSeconds(value)
+    if len(value) == 20 and value[10] == 'T' and value[19] == 'Z':
+        return _utcSeconds(value)
+    return _utcSeconds(parseTogglTime(value).isoformat())
+
+
+def clockifyEpoch(value):
+    """Converts a Clockify timestamp (2021-01-01T10:00:00Z) to integer seconds since the epoch."""
+    if len(value) == 20 and value[10] == 'T' and value[19] == 'Z':
+        return _utcSeconds(value)
+    return togglEpoch(value)
+
+
+def toEpoch(value):
+    """Seconds since the epoch of a datetime in UTC or a Clockify timestamp, integers are taken as
+    already converted."""
+    if isinstance(value, int):
+        return value
+    return clockifyEpoch(clockifyTime(value))
+
+
+def clockifyTime(value):
+    """Formats a datetime or seconds since the epoch for the Clockify API, strings are taken as
+    already formatted."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return time.strftime(CLOCKIFY_TIME_FORMAT, time.gmtime(value))
+    return value.strftime(CLOCKIFY_TIME_FORMAT)
+
+
+def shiftClockifyTime(value, delta):
+    if isinstance(value, int):
+        return clockifyTime(value + int(delta.total_seconds()))
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value, CLOCKIFY_TIME_FORMAT)
+    return (value + delta).strftime(CLOCKIFY_TIME_FORMAT)
@@ -0,0 +1,86 @@
+import sys
+
+from TimeConversion import clockifyEpoch, clockifyTime, togglEpoch
+
+# tags which only carry the billable flag, they are not kept as tags
+BILLABLE_TAGS = frozenset(("billable", "non-billable"))
+
+_NO_TAGS = frozenset()
+_tagSets = {_NO_TAGS: _NO_TAGS}
+
+
+def internTags(tags):
+    """Returns one shared frozenset per distinct set of tags, most entries of a workspace use the same few."""
+    tags = frozenset(tags)
+    return _tagSets.setdefault(tags, tags)
+
+
+def _intern(value):
+    return sys.intern(value) if value != None else None
+
+
+class TimeEntry:
+    """The fields of a time entry the sync compares and writes, without the rest of the API JSON.
+
+    Timestamps are integer seconds since the epoch (end is None for a running timer). For entries read
+    from Toggl `project` is the project name and `tags` the tag names, for entries read from Clockify
+    they are the project ID and the tag IDs. Repeated strings (IDs, project names) and the tag sets are
+    interned, so a year of entries of a whole company shares them.
+    """
+
+    __slots__ = ("id", "start", "end", "description", "project", "tags", "billable", "userId", "taskId")
+
+    def __init__(self, id, start, end, description, project=None, tags=_NO_TAGS, billable=False,
+                 userId=None, taskId=None):
+        self.id = id
+        self.start = start
+        self.end = end
+        self.description = description
+        self.project = project
+        self.tags = tags
+        self.billable = billable
+        self.userId = userId
+        self.taskId = taskId
+
+    @classmethod
+    def fromToggl(cls, row):
+        """Converts a Toggl v9 time entry. The billable/non-billable tags set the billable flag."""
+        tags = [tag.strip() for tag in row["tags"] or ()]
+        tags = internTags(tag for tag in tags if tag != "")
+        billable = "billable" in tags
+        if not tags.isdisjoint(BILLABLE_TAGS):
+            tags = internTags(tags - BILLABLE_TAGS)
+        return cls(row["id"], togglEpoch(row["start"]), togglEpoch(row["stop"]) if row["stop"] != None else None,
+                   row["description"], _intern(row.get("project_name")), tags, billable)
+
+    @classmethod
+    def fromClockify(cls, data):
+        """Converts a Clockify time entry as returned by the time-entries endpoints."""
+        interval = data["timeInterval"]
+        end = interval["end"]
+        tagIds = data.get("tagIds")
+        return cls(data["id"], clockifyEpoch(interval["start"]), clockifyEpoch(end) if end != None else None,
+                   data["description"], _intern(data.get("projectId")), internTags(tagIds) if tagIds else _NO_TAGS,
+                   bool(data.get("billable")), _intern(data.get("userId")), _intern(data.get("taskId")))
+
+    def key(self):
+        """Start, end and description, under which the entries are looked up for duplicates."""
+        return (self.start, self.end, self.description)
+
+    def addEntryArgs(self, userMail, workspace):
+        """Keyword arguments of ClockifyAPI.addEntry (and updateEntry) writing this Toggl entry for the user.
+        The tags only decide the billable flag, they are not written."""
+        return dict(start=self.start, description=self.description, projectName=self.project, userMail=userMail,
+                    workspace=workspace, end=self.end, billable=self.billable)
+
+    def __eq__(self, other):
+        if not isinstance(other, TimeEntry):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        end = clockifyTime(self.end) if self.end != None else None
+        return "TimeEntry(%r, %s - %s, %r, project=%r, tags=%r)" % (
+            self.id, clockifyTime(self.start), end, self.description, self.project, sorted(self.tags))
@@ -0,0 +1,234 @@
+import base64
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple, TypedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Metrics import getMetrics
+from RateLimiter import getRateLimiter, retryAfterSeconds
+
+# Toggl asks clients to stay around one request per second per API token, short bursts are tolerated
+TOGGL_RATE_LIMIT = 1
+TOGGL_BURST = 3
+
+
+class TogglTimeEntry(TypedDict, total=False):
+    id: int
+    workspace_id: int
+    project_id: Optional[int]
+    project_name: Optional[str]
+    client_name: Optional[str]
+    user_name: Optional[str]
+    description: str
+    start: str
+    stop: Optional[str]
+    at: str
+    tags: List[str]
+    server_deleted_at: Optional[str]
+
+
+def dateWindows(startDate: str, endDate: str, window="month") -> List[Tuple[str, str]]:
+    """Splits the YYYY-MM-DD range into consecutive (start, end) windows of a day, a week or a
+    calendar month, each window ends where the next one starts."""
+    start = datetime.date.fromisoformat(startDate)
+    end = datetime.date.fromisoformat(endDate)
+    windows = []
+    while start < end:
+        if window == "day":
+            nextStart = start + datetime.timedelta(days=1)
+        elif window == "week":
+            nextStart = start + datetime.timedelta(days=7)
+        elif window == "month":
+            nextStart = (start.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            raise RuntimeError("invalid window %s, use day, week or month" % window)
+        nextStart = min(nextStart, end)
+        windows.append((start.isoformat(), nextStart.isoformat()))
+        start = nextStart
+    if windows == []:
+        windows.append((startDate, endDate))
+    return windows
+
+
+class TogglAPI:
+    """Client of the Toggl Track v9 API and the v3 reports API.
+
+    All requests of one token share a pooled keep-alive session and a rate limiter which backs off
+    on 429. Workspaces, projects and clients are fetched once and resolved from memory afterwards
+    (and from the MetadataCache across runs when one is given).
+    """
+
+    def __init__(self, apiToken, sessionFactory=None, poolSize=10, rateLimit=TOGGL_RATE_LIMIT,
+                 maxRetries=5, cache=None, url='https://api.track.toggl.com/api/v9',
+                 reportsUrl='https://api.track.toggl.com/reports/api/v3'):
+        self.logger = logging.getLogger('clockify-automation')
+        self.url = url
+        self.reportsUrl = reportsUrl
+        self.apiToken = apiToken
+        self._poolSize = poolSize
+        self._rateLimit = rateLimit
+        self._maxRetries = maxRetries
+        self._cache = cache
+        self._sessionFactory = sessionFactory if sessionFactory != None else self._createSession
+        self._session = None
+        self._sessionLock = threading.Lock()
+        # the metadata cache is keyed by a digest, the token itself is not written to disk
+        self._cacheKey = "toggl:%s" % hashlib.sha256(apiToken.encode("utf-8")).hexdigest()[:16]
+        self.workspaces = None
+        self._projects = {}
+        self._clients = {}
+
+    def _createSession(self, token):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._poolSize, pool_maxsize=self._poolSize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        authString = base64.b64encode(("%s:api_token" % token).encode("ascii")).decode("ascii")
+        session.headers.update({
+            "Authorization": "Basic %s" % authString,
+            "Content-Type": "application/json",
+            "Connection": "keep-alive"})
+        return session
+
+    def close(self):
+        if self._session != None:
+            self._session.close()
+            self._session = None
+
+    def _send(self, method, url, params=None, json=None):
+        with self._sessionLock:
+            if self._session == None:
+                self._session = self._sessionFactory(self.apiToken)
+        limiter = getRateLimiter("toggl:%s" % self.apiToken, self._rateLimit, TOGGL_BURST)
+        metrics = getMetrics()
+        attempt = 0
+        while True:
+            metrics.recordSleep("toggl", limiter.acquire())
+            started = time.perf_counter()
+            response = self._session.request(method, url, params=params, json=json)
+            metrics.record("toggl", method, url, response.status_code, time.perf_counter() - started,
+                           len(response.request.body or b""), len(response.content))
+            if response.status_code != 429:
+                limiter.success()
+                break
+            if attempt >= self._maxRetries:
+                break
+            delay = limiter.backoff(retryAfterSeconds(response.headers))
+            self.logger.warning("toggl rate limited on %s, retrying in %.2fs" % (url, delay))
+            attempt += 1
+        response.raise_for_status()
+        return response
+
+    def getWorkspaces(self) -> List[dict]:
+        if self.workspaces == None:
+            if self._cache != None:
+                self.workspaces = self._cache.get(self._cacheKey, "workspaces")
+            if self.workspaces == None:
+                self.workspaces = self._send("GET", self.url + "/workspaces").json()
+                if self._cache != None:
+                    self._cache.put(self._cacheKey, "workspaces", self.workspaces)
+        return self.workspaces
+
+    def getWorkspaceID(self, workspaceName: str) -> int:
+        for ws in self.getWorkspaces():
+            if ws["name"] == workspaceName:
+                return int(ws["id"])
+        raise RuntimeError("Toggl workspace %s not found. Available workspaces: %s" % (
+            workspaceName, [ws["name"] for ws in self.workspaces]))
+
+    def getProjects(self, workspaceId: int) -> dict:
+        """Projects of the workspace keyed by their ID."""
+        if workspaceId not in self._projects:
+            url = self.url + "/workspaces/%d/projects" % workspaceId
+            self._projects[workspaceId] = {p["id"]: p for p in self._iterPages(url)}
+        return self._projects[workspaceId]
+
+    def getClients(self, workspaceId: int) -> dict:
+        """Clients of the workspace keyed by their ID."""
+        if workspaceId not in self._clients:
+            clients = self._send("GET", self.url + "/workspaces/%d/clients" % workspaceId).json()
+            self._clients[workspaceId] = {c["id"]: c for c in clients or []}
+        return self._clients[workspaceId]
+
+    def getProjectName(self, workspaceId: int, projectId: int) -> Optional[str]:
+        project = self.getProjects(workspaceId).get(projectId)
+        return project["name"] if project != None else None
+
+    def _iterPages(self, url, pageSize=200):
+        page = 1
+        while True:
+            data = self._send("GET", url, params={"page": page, "per_page": pageSize}).json() or []
+            yield from data
+            if len(data) < pageSize:
+                break
+            page += 1
+
+    def iterTimeEntries(self, startDate=None, endDate=None, since=None) -> Iterator[TogglTimeEntry]:
+        """Yields the time entries of the token owner with project, client and user names filled in
+        (`meta=true`). Either a `startDate`..`endDate` range (YYYY-MM-DD) or a `since` unix timestamp
+        returning everything changed since then, including deleted entries."""
+        params = {"meta": "true"}
+        if since != None:
+            params["since"] = since
+        else:
+            params["start_date"] = startDate
+            params["end_date"] = endDate
+        data = self._send("GET", self.url + "/me/time_entries", params=params).json()
+        yield from data or []
+
+    def iterTimeEntriesSharded(self, startDate, endDate, window="month", workers=4) -> Iterator[TogglTimeEntry]:
+        """Same as iterTimeEntries for a date range, but the range is split into day/week/month
+        windows fetched by `workers` threads. Entries are yielded in start time order without
+        duplicates; at most two windows per worker are held in memory at once."""
+        windows = dateWindows(startDate, endDate, window)
+        if len(windows) <= 1 or workers <= 1:
+            for winStart, winEnd in windows:
+                yield from self._fetchWindow(winStart, winEnd)
+            return
+
+        seen = set()
+        pending = deque()
+        nextWindow = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                while nextWindow < len(windows) or pending:
+                    while nextWindow < len(windows) and len(pending) < 2 * workers:
+                        pending.append(pool.submit(self._fetchWindow, *windows[nextWindow]))
+                        nextWindow += 1
+                    for entry in pending.popleft().result():
+                        if entry["id"] not in seen:
+                            seen.add(entry["id"])
+                            yield entry
+            finally:
+                for f in pending:
+                    f.cancel()
+
+    def _fetchWindow(self, startDate, endDate):
+        self.logger.info("fetching toggl entries from %s to %s" % (startDate, endDate))
+        return sorted(self.iterTimeEntries(startDate, endDate), key=lambda entry: entry["start"])
+
+    def iterReportEntries(self, workspaceId: int, startDate: str, endDate: str,
+                          pageSize=1000) -> Iterator[dict]:
+        """Yields the detailed report of the workspace one time entry at a time, following the
+        X-Next-Row-Number paging of the reports API."""
+        url = self.reportsUrl + "/workspace/%d/search/time_entries" % workspaceId
+        body = {"start_date": startDate, "end_date": endDate, "page_size": pageSize}
+        while True:
+            rv = self._send("POST", url, json=body)
+            for row in rv.json() or []:
+                entries = row.pop("time_entries", [])
+                for entry in entries:
+                    merged = dict(row)
+                    merged.update(entry)
+                    yield merged
+            nextRow = rv.headers.get("X-Next-Row-Number")
+            if not nextRow:
+                break
+            body["first_row_number"] = int(nextRow)
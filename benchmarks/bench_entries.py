@@ -0,0 +1,143 @@
+"""Memory and lookup benchmark of the prefetched Clockify entry index.
+
+Builds the duplicate index over N synthetic Clockify entries (shaped like the JSON the time-entries
+endpoint returns) once from the raw dicts, as ClockifyAPI kept them before TimeEntry, and once from
+TimeEntry objects, then reports the memory held by each index and the time to check every entry
+for a duplicate.
+
+    python benchmarks/bench_entries.py --entries 200000
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TimeEntry import TimeEntry  # noqa: E402
+
+
+def synthetic_json(count, users=50, projects=200, tags=20, seed=0):
+    """The entries serialized as one response body, so that parsing allocates them like requests does."""
+    rnd = random.Random(seed)
+    base = datetime.datetime(2021, 1, 1)
+    entries = []
+    for idx in range(count):
+        start = base + datetime.timedelta(seconds=rnd.randrange(365 * 24 * 3600))
+        end = start + datetime.timedelta(seconds=rnd.randrange(60, 8 * 3600))
+        entries.append({
+            'id': '%024x' % idx,
+            'description': f'task {rnd.randrange(count // 4 + 1)}',
+            'tagIds': ['%024x' % (10 ** 6 + t) for t in rnd.sample(range(tags), rnd.randrange(3))] or None,
+            'userId': '%024x' % (10 ** 7 + rnd.randrange(users)),
+            'billable': rnd.random() < 0.5,
+            'taskId': None,
+            'projectId': '%024x' % (10 ** 8 + rnd.randrange(projects)),
+            'timeInterval': {
+                'start': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'end': end.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'duration': 'PT%dS' % (end - start).total_seconds(),
+            },
+            'workspaceId': '%024x' % 1,
+            'isLocked': False,
+            'hourlyRate': None,
+            'costRate': None,
+            'customFieldValues': [],
+            'type': 'REGULAR',
+            'kioskId': None,
+            'approvalRequestId': None,
+            'projectCurrency': None,
+            'currentlyRunning': False,
+        })
+    return json.dumps(entries)
+
+
+def dict_index(entries):
+    index = {}
+    for entry in entries:
+        key = (entry['timeInterval']['start'], entry['timeInterval']['end'], entry['description'])
+        index.setdefault(key, []).append(entry)
+    return index
+
+
+def entry_index(entries):
+    index = {}
+    for data in entries:
+        entry = TimeEntry.fromClockify(data)
+        index.setdefault(entry.key(), []).append(entry)
+    return index
+
+
+def dict_lookups(index, entries):
+    found = 0
+    for entry in entries:
+        interval = entry['timeInterval']
+        for candidate in index.get((interval['start'], interval['end'], entry['description']), []):
+            if candidate['projectId'] == entry['projectId'] and candidate['userId'] == entry['userId'] and \
+                    set(candidate['tagIds'] or []) == set(entry['tagIds'] or []):
+                found += 1
+                break
+    return found
+
+
+def entry_lookups(index, entries):
+    found = 0
+    for entry in entries:
+        for candidate in index.get(entry.key(), []):
+            if candidate.project == entry.project and candidate.userId == entry.userId and candidate.tags == entry.tags:
+                found += 1
+                break
+    return found
+
+
+def build(func, body):
+    """Parses the body and builds the index from it, returns the index, the memory it keeps alive and
+    the build time (measured in a second, untraced build)."""
+    gc.collect()
+    tracemalloc.start()
+    index = func(json.loads(body))
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    entries = json.loads(body)
+    started = time.perf_counter()
+    func(entries)
+    return index, size, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    args = parser.parse_args()
+
+    body = synthetic_json(args.entries)
+    dicts, dict_size, dict_build = build(dict_index, body)
+    entries, entry_size, entry_build = build(entry_index, body)
+
+    raw = json.loads(body)
+    probes = [TimeEntry.fromClockify(data) for data in raw]
+    started = time.perf_counter()
+    dict_found = dict_lookups(dicts, raw)
+    dict_lookup = time.perf_counter() - started
+    started = time.perf_counter()
+    entry_found = entry_lookups(entries, probes)
+    entry_lookup = time.perf_counter() - started
+    if dict_found != entry_found or entry_found != args.entries:
+        print(f'FAIL: found {dict_found} with dicts and {entry_found} with TimeEntry of {args.entries}')
+        sys.exit(1)
+
+    print(f'entries:     {args.entries}')
+    print(f'dict index:  {dict_size / 1024 / 1024:8.1f} MiB, built in {dict_build:.3f}s, '
+          f'lookups {dict_lookup:.3f}s')
+    print(f'TimeEntry:   {entry_size / 1024 / 1024:8.1f} MiB, built in {entry_build:.3f}s, '
+          f'lookups {entry_lookup:.3f}s')
+    print(f'memory:      {dict_size / entry_size:.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
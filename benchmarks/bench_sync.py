@@ -0,0 +1,131 @@
+"""End-to-end benchmark of main.py against the local Clockify/Toggl stand-in.
+
+Generates N synthetic Toggl entries, runs the sync into an empty Clockify workspace and reports the
+wall time, the requests per endpoint and the peak memory. `--runs 2` repeats the sync on the filled
+workspace, which measures the duplicate detection.
+
+    python benchmarks/bench_sync.py --entries 2000 --latency 0.02 --workers 8
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin import StandIn  # noqa: E402
+
+CLOCKIFY_TOKEN = 'clockify-token'
+TOGGL_TOKEN = 'toggl-token'
+ADMIN_EMAIL = 'admin@example.com'
+
+
+def populate(standin: StandIn, entries: int, projects: int, start: datetime.date, end: datetime.date, seed=0):
+    rnd = random.Random(seed)
+    standin.add_clockify_user(CLOCKIFY_TOKEN, ADMIN_EMAIL)
+    standin.add_toggl_token(TOGGL_TOKEN)
+    names = [f'Project {idx}' for idx in range(projects)]
+    for name in names:
+        standin.add_project(name)
+    begin = datetime.datetime.combine(start, datetime.time(), tzinfo=datetime.timezone.utc)
+    seconds = int((end - start).total_seconds())
+    for idx in range(entries):
+        entry_start = begin + datetime.timedelta(seconds=rnd.randrange(seconds - 8 * 3600))
+        entry_stop = entry_start + datetime.timedelta(seconds=rnd.randrange(60, 8 * 3600))
+        tags = ['billable'] if rnd.random() < 0.5 else []
+        standin.add_toggl_entry(entry_start, entry_stop, f'task {idx}', rnd.choice(names), tags)
+
+
+def write_config(path: str, standin: StandIn, args, start: datetime.date, end: datetime.date):
+    config = {
+        'ClockifyApiKey': CLOCKIFY_TOKEN,
+        'ClockifyAdminEmail': ADMIN_EMAIL,
+        'ClockifyWorkspace': standin.clockify_workspace,
+        'ClockifyUrl': standin.clockify_url,
+        'ToggleApiKey': TOGGL_TOKEN,
+        'ToggleWorkspace': standin.toggl_workspace,
+        'ToggleUrl': standin.toggl_url,
+        'ToggleFilterClient': '',
+        'ToggleFilterUser': '',
+        'From': start.isoformat(),
+        'To': end.isoformat(),
+        'DeleteExistingFrom': False,
+        'DryRun': False,
+        'ClockifyRateLimit': args.clockify_rate_limit,
+        'ToggleRateLimit': args.toggl_rate_limit,
+        'ToggleWindow': args.window,
+        'Reconcile': args.reconcile,
+        'CacheTTL': 0,
+    }
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def run_sync(main_module, standin: StandIn, workers: int) -> dict:
+    standin.requests.clear()
+    standin.throttled.clear()
+    tracemalloc.start()
+    started = time.perf_counter()
+    main_module.main(workers=workers)
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'wall': wall, 'peak': peak, 'requests': standin.endpoint_counts(),
+            'throttled': sum(standin.throttled.values())}
+
+
+def report(run: int, result: dict, entries: int, standin: StandIn):
+    total = sum(result['requests'].values())
+    print(f'run {run}:')
+    print(f'  wall time:      {result["wall"]:.2f}s ({entries / result["wall"]:.0f} entries/s)')
+    print(f'  peak memory:    {result["peak"] / 1024 / 1024:.1f} MiB (traced Python allocations, stand-in included)')
+    print(f'  requests:       {total} ({result["throttled"]} answered with 429)')
+    for endpoint, count in sorted(result['requests'].items(), key=lambda item: -item[1]):
+        print(f'    {count:7d}  {endpoint}')
+    print(f'  clockify:       {len(standin.entries)} entries')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--projects', type=int, default=20)
+    parser.add_argument('--days', type=int, default=90, help='length of the synced range')
+    parser.add_argument('--workers', type=int, default=4, help='upload threads of main.py')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--server-rate-limit', type=float, default=None,
+                        help='requests per second and token before the stand-in answers 429')
+    parser.add_argument('--clockify-rate-limit', type=float, default=50, help='ClockifyRateLimit of main.py')
+    parser.add_argument('--toggl-rate-limit', type=float, default=1, help='ToggleRateLimit of main.py')
+    parser.add_argument('--window', default='month', choices=['day', 'week', 'month'])
+    parser.add_argument('--reconcile', action='store_true', help='sync with Reconcile enabled')
+    parser.add_argument('--runs', type=int, default=1, help='number of syncs into the same workspace')
+    args = parser.parse_args()
+
+    start = datetime.date(2021, 1, 1)
+    end = start + datetime.timedelta(days=args.days)
+    workdir = tempfile.mkdtemp(prefix='bench_sync_')
+    os.chdir(workdir)
+
+    with StandIn(latency=args.latency, rate_limit=args.server_rate_limit) as standin:
+        populate(standin, args.entries, args.projects, start, end)
+        write_config(os.path.join(workdir, 'config.json'), standin, args, start, end)
+
+        import main as main_module
+        logging.getLogger('clockify-automation').setLevel(logging.ERROR)
+        main_module.load_config(os.path.join(workdir, 'config.json'))
+
+        print(f'entries: {args.entries}, latency: {args.latency * 1000:.0f}ms, workers: {args.workers}, '
+              f'server rate limit: {args.server_rate_limit or "none"}')
+        for run in range(1, args.runs + 1):
+            report(run, run_sync(main_module, standin, args.workers), args.entries, standin)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Micro-benchmark of the Toggl -> Clockify timestamp conversion.
+
+Compares the conversion chain main.py and ClockifyAPI used before TimeConversion (strptime ->
+strftime -> strptime per timestamp in main.py, then strftime for start, end, the +3h search window
+and again for the duplicate query) with the current one (togglEpoch when the Toggl entry is read,
+clockifyTime for the request body), and checks that both produce exactly the same strings for the
+UTC timestamps Toggl sends.
+
+Timestamps with another offset or with fractions of a second are checked separately against a
+plain fromisoformat conversion: togglEpoch normalizes them to UTC and drops the fraction, on
+purpose unlike the legacy chain, which sent the local time marked as UTC and failed on fractions.
+
+    python benchmarks/bench_timestamps.py --rows 100000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from TimeConversion import clockifyTime, togglEpoch  # noqa: E402
+
+CSV_DATE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+OFFSETS = [datetime.timezone(datetime.timedelta(hours=hours, minutes=minutes))
+           for hours, minutes in ((2, 0), (-5, 0), (5, 30), (-9, -30))]
+
+
+def synthetic_rows(count, seed=0, mixed=False):
+    """UTC rows like Toggl sends them, `mixed` rows also use other offsets and fractions of a second."""
+    rnd = random.Random(seed)
+    base = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+    rows = []
+    for _ in range(count):
+        start = base + datetime.timedelta(seconds=rnd.randrange(365 * 24 * 3600))
+        stop = start + datetime.timedelta(seconds=rnd.randrange(60, 8 * 3600))
+        if mixed and rnd.random() < 0.3:
+            tz = rnd.choice(OFFSETS)
+            start, stop = start.astimezone(tz), stop.astimezone(tz)
+        if mixed and rnd.random() < 0.3:
+            start = start.replace(microsecond=rnd.randrange(1, 10 ** 6))
+            stop = stop.replace(microsecond=rnd.randrange(1, 10 ** 6))
+        rows.append({'start': start.isoformat(), 'stop': stop.isoformat()})
+    return rows
+
+
+def reference(value):
+    return datetime.datetime.fromisoformat(value).astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def check_mixed(rows):
+    """Number of rows converted unlike expected. UTC rows have to match the legacy chain, the others
+    the reference conversion, and differ from the legacy output."""
+    wrong = 0
+    for row in rows:
+        converted = fast([row])[0]
+        try:
+            previous = legacy([row])[0]
+        except ValueError:
+            # fractions of a second were not understood by the legacy chain
+            previous = None
+        utc = row['start'].endswith('+00:00') and row['stop'].endswith('+00:00')
+        if utc and previous is not None:
+            wrong += converted != previous
+        else:
+            wrong += converted != (reference(row['start']), reference(row['stop']))
+            wrong += previous is not None and converted == previous
+    return wrong
+
+
+def legacy(rows):
+    out = []
+    for row in rows:
+        # main.py
+        start = datetime.datetime.strptime(row["start"], "%Y-%m-%dT%H:%M:%S%z").strftime(CSV_DATE_TIME_FORMAT)
+        start = datetime.datetime.strptime(start, CSV_DATE_TIME_FORMAT)
+        end = datetime.datetime.strptime(row["stop"], "%Y-%m-%dT%H:%M:%S%z").strftime(CSV_DATE_TIME_FORMAT)
+        end = datetime.datetime.strptime(end, CSV_DATE_TIME_FORMAT)
+        # ClockifyAPI.addEntry
+        startTime = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+        (end + datetime.timedelta(hours=3)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        endTime = end.strftime('%Y-%m-%dT%H:%M:%SZ')
+        # ClockifyAPI.getTimeEntryForUser
+        start.strftime('%Y-%m-%dT%H:%M:%SZ')
+        out.append((startTime, endTime))
+    return out
+
+
+def fast(rows):
+    return [(clockifyTime(togglEpoch(row['start'])), clockifyTime(togglEpoch(row['stop']))) for row in rows]
+
+
+def measure(func, rows, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    legacy_time, legacy_out = measure(legacy, rows, args.repeat)
+    fast_time, fast_out = measure(fast, rows, args.repeat)
+
+    if legacy_out != fast_out:
+        mismatches = sum(1 for a, b in zip(legacy_out, fast_out) if a != b)
+        print(f'FAIL: {mismatches} of {len(rows)} rows differ')
+        sys.exit(1)
+    mixed = synthetic_rows(min(args.rows, 10000), seed=1, mixed=True)
+    wrong = check_mixed(mixed)
+    if wrong:
+        print(f'FAIL: {wrong} of {len(mixed)} rows with offsets or fractions converted wrong')
+        sys.exit(1)
+
+    print(f'rows:        {len(rows)}')
+    print(f'legacy:      {legacy_time:.3f}s ({legacy_time / len(rows) * 1e6:.2f} us/row)')
+    print(f'fast:        {fast_time:.3f}s ({fast_time / len(rows) * 1e6:.2f} us/row)')
+    print(f'speedup:     {legacy_time / fast_time:.1f}x')
+    print('output:      identical, offsets and fractions normalized to UTC')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""In-process HTTP stand-in for the Clockify and Toggl endpoints used by ClockifyAPI, TogglAPI and main.py.
+
+Serves users, workspaces, projects, clients, tags, tasks and time entries from memory with the same
+pagination as the real services. Every request can be delayed by a fixed latency and every API token
+can be limited to a number of requests per second, answering `429 Too Many Requests` with a
+`Retry-After` header beyond it. Requests are counted per endpoint, and an endpoint can be made to
+fail after a number of requests.
+
+    with StandIn(latency=0.02, rate_limit=50) as standin:
+        standin.add_clockify_user('token', 'admin@example.com')
+        ClockifyAPI('token', 'admin@example.com', url=standin.clockify_url)
+"""
+import base64
+import datetime
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+CLOCKIFY_PREFIX = '/clockify/api/v1'
+TOGGL_PREFIX = '/toggl/api/v9'
+WORKSPACE_ID = 'ws1'
+TOGGL_WORKSPACE_ID = 1
+
+
+def _parse_time(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class _Reply(Exception):
+    def __init__(self, status: int, body=None, headers: Optional[dict] = None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class StandIn:
+    def __init__(self, latency: float = 0.0, rate_limit: Optional[float] = None, retry_after: float = 1.0,
+                 clockify_workspace: str = 'Workspace', toggl_workspace: str = 'Toggl Workspace'):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.clockify_workspace = clockify_workspace
+        self.toggl_workspace = toggl_workspace
+        self.requests = Counter()
+        self.throttled = Counter()
+        self.failing = {}
+        # like some Clockify endpoints: larger pages are refused, pages past the end repeat the last one
+        self.max_page_size: Optional[int] = None
+        self.repeat_last_page = False
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._recent = defaultdict(deque)
+        self.users = {}
+        self.projects: List[dict] = []
+        self.clients: List[dict] = []
+        self.tags: List[dict] = []
+        self.tasks: List[dict] = []
+        self.entries: List[dict] = []
+        self.toggl_tokens = set()
+        self.toggl_projects: List[dict] = []
+        self.toggl_clients: List[dict] = []
+        self.toggl_entries: List[dict] = []
+        self._server = None
+        self._thread = None
+        self._routes = [
+            ('GET', CLOCKIFY_PREFIX + r'/user', self._user),
+            ('GET', CLOCKIFY_PREFIX + r'/workspaces', self._workspaces),
+            ('GET', CLOCKIFY_PREFIX + r'/workspace/(?P<ws>\w+)/users', self._workspace_users),
+            ('GET', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/users', self._workspace_users),
+            ('GET', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/(?P<kind>projects|clients|tags)/?', self._list),
+            ('POST', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/(?P<kind>projects|clients|tags)/?', self._create),
+            ('DELETE', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/(?P<kind>projects|clients)/(?P<id>\w+)',
+             self._delete),
+            ('GET', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/projects/(?P<project>\w+)/tasks/?', self._tasks),
+            ('POST', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/projects/(?P<project>\w+)/tasks/?',
+             self._add_task),
+            ('GET', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/user/(?P<user>\w+)/time-entries', self._entries),
+            ('DELETE', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/user/(?P<user>\w+)/time-entries',
+             self._bulk_delete),
+            ('POST', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/time-entries', self._add_entry),
+            ('GET', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/time-entries/(?P<id>\w+)', self._entry),
+            ('PUT', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/time-entries/(?P<id>\w+)', self._update_entry),
+            ('DELETE', CLOCKIFY_PREFIX + r'/workspaces/(?P<ws>\w+)/time-entries/(?P<id>\w+)', self._delete_entry),
+            ('GET', TOGGL_PREFIX + r'/me', self._toggl_me),
+            ('GET', TOGGL_PREFIX + r'/workspaces', self._toggl_workspaces),
+            ('GET', TOGGL_PREFIX + r'/workspaces/(?P<ws>\d+)/projects', self._toggl_projects),
+            ('GET', TOGGL_PREFIX + r'/workspaces/(?P<ws>\d+)/clients', self._toggl_clients),
+            ('GET', TOGGL_PREFIX + r'/me/time_entries', self._toggl_entries),
+        ]
+        self._routes = [(method, re.compile(pattern), handler) for method, pattern, handler in self._routes]
+
+    # --- data -------------------------------------------------------------------------------------
+
+    def _new_id(self, prefix: str) -> str:
+        return f'{prefix}{next(self._ids)}'
+
+    def add_clockify_user(self, token: str, email: str, name: Optional[str] = None) -> dict:
+        user = {'id': self._new_id('u'), 'email': email, 'name': name or email.split('@')[0], 'status': 'ACTIVE'}
+        self.users[token] = user
+        return user
+
+    def add_project(self, name: str, client: Optional[str] = None) -> dict:
+        project = {'id': self._new_id('p'), 'name': name, 'clientName': client or '', 'archived': False}
+        self.projects.append(project)
+        return project
+
+    def add_tag(self, name: str) -> dict:
+        tag = {'id': self._new_id('t'), 'name': name}
+        self.tags.append(tag)
+        return tag
+
+    def add_toggl_token(self, token: str):
+        self.toggl_tokens.add(token)
+
+    def add_toggl_entry(self, start: datetime.datetime, stop: datetime.datetime, description: str,
+                        project_name: str, tags: Optional[List[str]] = None, client_name: str = '',
+                        user_name: str = '') -> dict:
+        project = next((p for p in self.toggl_projects if p['name'] == project_name), None)
+        if project is None:
+            client = next((c for c in self.toggl_clients if c['name'] == client_name), None)
+            if client is None and client_name:
+                client = {'id': len(self.toggl_clients) + 1, 'name': client_name}
+                self.toggl_clients.append(client)
+            project = {'id': len(self.toggl_projects) + 1, 'name': project_name,
+                       'client_id': client['id'] if client is not None else None}
+            self.toggl_projects.append(project)
+        entry = {
+            'id': len(self.toggl_entries) + 1,
+            'workspace_id': TOGGL_WORKSPACE_ID,
+            'project_id': project['id'],
+            'project_name': project_name,
+            'client_name': client_name,
+            'user_name': user_name,
+            'description': description,
+            'start': start.isoformat(),
+            'stop': stop.isoformat(),
+            'at': stop.isoformat(),
+            'tags': tags or [],
+            'server_deleted_at': None,
+        }
+        self.toggl_entries.append(entry)
+        return entry
+
+    # --- server -----------------------------------------------------------------------------------
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def clockify_url(self) -> str:
+        return self.base_url + CLOCKIFY_PREFIX
+
+    @property
+    def toggl_url(self) -> str:
+        return self.base_url + TOGGL_PREFIX
+
+    def start(self) -> 'StandIn':
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, payload, headers = standin.handle(self.command, self.path, self.headers, body)
+                data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'StandIn':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _token(self, headers) -> str:
+        if headers.get('X-Api-Key'):
+            return headers['X-Api-Key']
+        auth = headers.get('Authorization', '')
+        if auth.startswith('Basic '):
+            return base64.b64decode(auth[6:]).decode('utf-8').split(':')[0]
+        return ''
+
+    def _throttle(self, token: str) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent[token]
+            while recent and now - recent[0] >= 1.0:
+                recent.popleft()
+            if len(recent) >= self.rate_limit:
+                return True
+            recent.append(now)
+            return False
+
+    def handle(self, method: str, path: str, headers, body: bytes):
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlsplit(path)
+        query = parse_qs(parts.query)
+        params = {key: values if len(values) > 1 or key == 'time-entry-ids' else values[0]
+                  for key, values in query.items()}
+        token = self._token(headers)
+        for route_method, pattern, handler in self._routes:
+            match = pattern.fullmatch(parts.path)
+            if match is None or route_method != method:
+                continue
+            endpoint = f'{method} {self._endpoint(parts.path, match)}'
+            if self._throttle(token):
+                with self._lock:
+                    self.throttled[endpoint] += 1
+                return 429, {'message': 'Too many requests'}, {'Retry-After': str(self.retry_after)}
+            with self._lock:
+                self.requests[endpoint] += 1
+                if endpoint in self.failing and self.requests[endpoint] > self.failing[endpoint][0]:
+                    return self.failing[endpoint][1], {'message': 'failing on purpose'}, {}
+            try:
+                payload = json.loads(body) if body else None
+                with self._lock:
+                    return handler(token, params, payload, **match.groupdict())
+            except _Reply as reply:
+                return reply.status, reply.body, reply.headers
+        return 404, {'message': f'no stand-in for {method} {parts.path}'}, {}
+
+    @staticmethod
+    def _endpoint(path: str, match) -> str:
+        # IDs in the path are replaced by the group name, e.g. clockify/workspaces/{ws}/time-entries
+        for key in sorted(match.groupdict(), key=match.start, reverse=True):
+            if key != 'kind':
+                path = path[:match.start(key)] + '{' + key + '}' + path[match.end(key):]
+        return path.replace(CLOCKIFY_PREFIX, 'clockify', 1).replace(TOGGL_PREFIX, 'toggl', 1).rstrip('/')
+
+    def fail_after(self, endpoint: str, count: int, status: int = 503):
+        """Answers `status` to the requests of the endpoint (named as in endpoint_counts) after the first `count`."""
+        self.failing[endpoint] = (count, status)
+
+    def endpoint_counts(self) -> dict:
+        return dict(self.requests)
+
+    # --- clockify ---------------------------------------------------------------------------------
+
+    def _clockify_user(self, token: str) -> dict:
+        user = self.users.get(token)
+        if user is None:
+            raise _Reply(401, {'message': 'invalid API key'})
+        return user
+
+    def _page(self, items: list, params: dict) -> tuple:
+        if 'page' not in params:
+            return 200, items[:50], {}
+        page = int(params['page'])
+        size = int(params.get('page-size', 50))
+        if self.max_page_size is not None and size > self.max_page_size:
+            raise _Reply(400, {'message': f'page-size is limited to {self.max_page_size}'})
+        if self.repeat_last_page and items:
+            page = min(page, (len(items) + size - 1) // size)
+        return 200, items[(page - 1) * size:page * size], {}
+
+    def _user(self, token, params, body):
+        return 200, self._clockify_user(token), {}
+
+    def _workspaces(self, token, params, body):
+        self._clockify_user(token)
+        return 200, [{'id': WORKSPACE_ID, 'name': self.clockify_workspace}], {}
+
+    def _workspace_users(self, token, params, body, ws):
+        self._clockify_user(token)
+        return 200, [{'id': u['id'], 'email': u['email'], 'name': u['name']} for u in self.users.values()], {}
+
+    def _list(self, token, params, body, ws, kind):
+        self._clockify_user(token)
+        return self._page(getattr(self, kind), params)
+
+    def _create(self, token, params, body, ws, kind):
+        self._clockify_user(token)
+        items = getattr(self, kind)
+        if any(item['name'] == body['name'] for item in items):
+            raise _Reply(400, {'message': f'{kind} {body["name"]} already exists'})
+        item = dict(body, id=self._new_id(kind[0]))
+        items.append(item)
+        return 201, item, {}
+
+    def _delete(self, token, params, body, ws, kind, id):
+        self._clockify_user(token)
+        items = getattr(self, kind)
+        remaining = [item for item in items if item['id'] != id]
+        if len(remaining) == len(items):
+            raise _Reply(404, {'message': f'{kind} {id} not found'})
+        setattr(self, kind, remaining)
+        return 200, {}, {}
+
+    def _tasks(self, token, params, body, ws, project):
+        self._clockify_user(token)
+        return self._page([task for task in self.tasks if task['projectId'] == project], params)
+
+    def _add_task(self, token, params, body, ws, project):
+        self._clockify_user(token)
+        if any(task['projectId'] == project and task['name'] == body['name'] for task in self.tasks):
+            raise _Reply(400, {'message': 'task already exists'})
+        task = {'id': self._new_id('k'), 'name': body['name'], 'projectId': project}
+        self.tasks.append(task)
+        return 201, task, {}
+
+    def _entries(self, token, params, body, ws, user):
+        self._clockify_user(token)
+        entries = [entry for entry in self.entries if entry['userId'] == user]
+        if params.get('start'):
+            start = _parse_time(params['start'])
+            entries = [entry for entry in entries if _parse_time(entry['timeInterval']['start']) >= start]
+        if params.get('end'):
+            end = _parse_time(params['end'])
+            entries = [entry for entry in entries if _parse_time(entry['timeInterval']['start']) <= end]
+        if params.get('description'):
+            entries = [entry for entry in entries if params['description'] in entry['description']]
+        entries.sort(key=lambda entry: entry['timeInterval']['start'], reverse=True)
+        return self._page(entries, params)
+
+    def _bulk_delete(self, token, params, body, ws, user):
+        self._clockify_user(token)
+        ids = set(params.get('time-entry-ids', []))
+        deleted = [entry for entry in self.entries if entry['id'] in ids and entry['userId'] == user]
+        self.entries = [entry for entry in self.entries if entry not in deleted]
+        return 200, deleted, {}
+
+    def _entry_from(self, body: dict, entry_id: str, user_id: str) -> dict:
+        return {
+            'id': entry_id,
+            'description': body.get('description', ''),
+            'projectId': body.get('projectId'),
+            'taskId': body.get('taskId'),
+            'tagIds': body.get('tagIds'),
+            'billable': body.get('billable', False),
+            'userId': user_id,
+            'workspaceId': WORKSPACE_ID,
+            'timeInterval': {'start': body['start'], 'end': body.get('end')},
+        }
+
+    def _add_entry(self, token, params, body, ws):
+        user = self._clockify_user(token)
+        entry = self._entry_from(body, self._new_id('e'), user['id'])
+        self.entries.append(entry)
+        return 201, entry, {}
+
+    def _entry(self, token, params, body, ws, id):
+        self._clockify_user(token)
+        for entry in self.entries:
+            if entry['id'] == id:
+                return 200, entry, {}
+        raise _Reply(404, {'message': f'time entry {id} not found'})
+
+    def _update_entry(self, token, params, body, ws, id):
+        self._clockify_user(token)
+        for idx, entry in enumerate(self.entries):
+            if entry['id'] == id:
+                self.entries[idx] = self._entry_from(body, id, entry['userId'])
+                return 200, self.entries[idx], {}
+        raise _Reply(404, {'message': f'time entry {id} not found'})
+
+    def _delete_entry(self, token, params, body, ws, id):
+        self._clockify_user(token)
+        remaining = [entry for entry in self.entries if entry['id'] != id]
+        if len(remaining) == len(self.entries):
+            raise _Reply(404, {'message': f'time entry {id} not found'})
+        self.entries = remaining
+        return 204, None, {}
+
+    # --- toggl ------------------------------------------------------------------------------------
+
+    def _toggl_token(self, token: str):
+        if token not in self.toggl_tokens:
+            raise _Reply(403, {'message': 'invalid API token'})
+
+    def _toggl_me(self, token, params, body):
+        self._toggl_token(token)
+        return 200, {'id': 1, 'default_workspace_id': TOGGL_WORKSPACE_ID}, {}
+
+    def _toggl_workspaces(self, token, params, body):
+        self._toggl_token(token)
+        return 200, [{'id': TOGGL_WORKSPACE_ID, 'name': self.toggl_workspace}], {}
+
+    def _toggl_projects(self, token, params, body, ws):
+        self._toggl_token(token)
+        page = int(params.get('page', 1))
+        size = int(params.get('per_page', 200))
+        return 200, self.toggl_projects[(page - 1) * size:page * size], {}
+
+    def _toggl_clients(self, token, params, body, ws):
+        self._toggl_token(token)
+        return 200, self.toggl_clients, {}
+
+    def _toggl_entries(self, token, params, body):
+        self._toggl_token(token)
+        if params.get('since'):
+            since = int(params['since'])
+            return 200, [e for e in self.toggl_entries if _parse_time(e['at']).timestamp() >= since], {}
+        start = datetime.date.fromisoformat(params['start_date'])
+        end = datetime.date.fromisoformat(params['end_date'])
+        return 200, [e for e in self.toggl_entries
+                     if start <= _parse_time(e['start']).date() < end and e['server_deleted_at'] is None], {}
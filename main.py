@@ -1,11 +1,26 @@
+import argparse
 import datetime
+import itertools
 import json
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import requests
-from ClockifyAPI import ClockifyAPI
-import base64
+from ClockifyAPI import ClockifyAPI, CLOCKIFY_RATE_LIMIT, RetVal
+from MetadataCache import MetadataCache
+from Metrics import getMetrics
+from Profiling import run_profiled
+from Reconcile import apply_plan, plan_reconcile
+from SyncJournal import SyncJournal, journal_job
+from SyncPipeline import SyncPipeline
+from TimeConversion import clockifyTime, togglEpoch
+from TimeEntry import TimeEntry
+from TogglAPI import TogglAPI, TOGGL_RATE_LIMIT
 
 formatter = logging.Formatter(fmt='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
 
@@ -20,9 +35,17 @@ logger.addHandler(handler)
 logger.addHandler(fileHandler)
 
 CSV_DATE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Toggl only serves changes of the last three months through the `since` parameter
+TOGGL_SINCE_MAX_AGE = datetime.timedelta(days=90)
 
-with open('config.json') as config_file:
-    config = json.load(config_file)
+config = {}
+state_lock = threading.Lock()
+
+
+def load_config(path: str = 'config.json'):
+    with open(path) as config_file:
+        config.clear()
+        config.update(json.load(config_file))
 
 
 @dataclass
@@ -32,100 +55,509 @@ class ServiceSettings:
     email: Optional[str] = None
 
 
-def delete_entries(clockify: ClockifyAPI, clockify_settings: ServiceSettings, from_datetime: str):
-    clockify.deleteEntriesOfUser(
+def delete_entries(clockify: ClockifyAPI, clockify_settings: ServiceSettings, from_datetime: str, to_datetime: str):
+    deleted, failed = clockify.deleteEntriesOfUser(
         clockify_settings.email,
         clockify_settings.workspace,
-        datetime.datetime.strptime(from_datetime, CSV_DATE_TIME_FORMAT).astimezone(datetime.timezone.utc)
+        datetime.datetime.strptime(from_datetime, CSV_DATE_TIME_FORMAT).astimezone(datetime.timezone.utc),
+        datetime.datetime.strptime(to_datetime, CSV_DATE_TIME_FORMAT).astimezone(datetime.timezone.utc)
     )
+    if failed:
+        logger.warning(f'Deleted {deleted} entries, failed to delete {len(failed)}: {failed}')
 
-def get_target_workspace_id(workspace_name: str, headers: dict):
-    response = requests.get('https://api.track.toggl.com/api/v9/workspaces', headers=headers)
-    response.raise_for_status()
-    workspaces = response.json()
-    for workspace in workspaces:
-        if workspace['name'] == workspace_name:
-            return str(workspace['id'])
-    return None
-
-def main():
-    clockify_settings = ServiceSettings(
-        config['ClockifyApiKey'],
-        config['ClockifyWorkspace'],
-        config['ClockifyAdminEmail']
+def prefetch_entries(clockify: ClockifyAPI, clockify_settings: ServiceSettings, from_date: str, to_date: str):
+    # one day of margin on both sides as Toggl interprets the dates in the user's timezone
+    clockify.prefetchTimeEntries(
+        clockify_settings.email,
+        clockify_settings.workspace,
+        datetime.datetime.strptime(from_date, '%Y-%m-%d') - datetime.timedelta(days=1),
+        datetime.datetime.strptime(to_date, '%Y-%m-%d') + datetime.timedelta(days=2)
     )
 
-    toggle_settings = ServiceSettings(
-        config['ToggleApiKey'],
-        config['ToggleWorkspace']
-    )
+def shift_date(date: str, days: int) -> str:
+    return (datetime.date.fromisoformat(date) + datetime.timedelta(days=days)).isoformat()
+
+def load_state(state_file: str, key: str) -> Tuple[Optional[int], Optional[Dict[int, str]]]:
+    """The watermark of the last incremental run and the Clockify ID of every Toggl entry synced so far,
+    None if there is no record of them."""
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None, None
+    # the watermarks are stored by their key, the keys all contain a slash so they never clash with 'entries'
+    entry_ids = state.get('entries', {}).get(key)
+    if entry_ids is not None:
+        entry_ids = {int(toggl_id): clockify_id for toggl_id, clockify_id in entry_ids.items()}
+    return state.get(key), entry_ids
+
+def save_state(state_file: str, key: str, watermark: Optional[int] = None,
+               entry_ids: Optional[Dict[int, str]] = None):
+    # the users of a batch share the state file
+    with state_lock:
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {}
+        if watermark is not None:
+            state[key] = watermark
+        if entry_ids is not None:
+            state.setdefault('entries', {})[key] = {str(toggl_id): clockify_id
+                                                    for toggl_id, clockify_id in entry_ids.items()}
+        with open(f'{state_file}.tmp', 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(f'{state_file}.tmp', state_file)
+
+@dataclass
+class SyncItem:
+    toggl_id: int
+    entry: TimeEntry
+    deleted: bool = False
+    result: Optional[RetVal] = None
+    clockify_id: Optional[str] = None
+    seq: int = -1
+
+
+def track_watermark(rows: Iterable[dict], state: dict) -> Iterator[dict]:
+    # remembers the newest change seen in Toggl while the rows stream through
+    for row in rows:
+        if row.get('at') is not None:
+            state['watermark'] = max(state['watermark'] or 0, togglEpoch(row['at']))
+        yield row
+
+def skip_journaled(rows: Iterable[dict], done: dict, state: dict) -> Iterator[dict]:
+    # rows a crashed run already synced are dropped before any work is done on them
+    for row in rows:
+        if done.get(row['id']) in ('OK', 'EXISTS'):
+            state['skipped'] += 1
+            continue
+        yield row
+
+def prefetch_once(prefetch: Callable[[], None], state: dict, item: SyncItem) -> List[SyncItem]:
+    # Clockify is only asked for its entries once there is something to compare them with
+    if not state['done']:
+        prefetch()
+        state['done'] = True
+    return [item]
+
+def filter_row(target_workspace_id: int, job: dict, row: dict) -> List[dict]:
+    if row['stop'] == None: # if task is still running
+        return []
+    if int(row['workspace_id']) != target_workspace_id:
+        return []
+    if row['project_id'] == None:
+        raise Exception(f'task "{row["description"]}" from {row["start"]} has no assigned project (project_id is None)')
+    if job['ToggleFilterClient'] != row['client_name'] and job['ToggleFilterClient'] != '':
+        return []
+    if job['ToggleFilterUser'] != row['user_name'] and job['ToggleFilterUser'] != '':
+        return []
+    return [row]
 
-    clockify = ClockifyAPI(clockify_settings.token, clockify_settings.email, reqTimeout=1)
-    clockify.getProjects(workspace=clockify_settings.workspace)
+def convert_row(date_range: Optional[tuple], entry_ids: Optional[Dict[int, str]], row: dict) -> List[SyncItem]:
+    # only the synced fields are kept from here on, with the timestamps as epoch seconds
+    entry = TimeEntry.fromToggl(row)
+    deleted = row.get('server_deleted_at') is not None
+    if date_range is not None and not date_range[0] <= entry.start < date_range[1]:
+        if entry_ids is None or row['id'] not in entry_ids:
+            return []
+        # moved out of the range since it was synced, its copy is removed
+        deleted = True
+    return [SyncItem(row['id'], entry, deleted=deleted)]
 
-    toggle_base_url = 'https://api.track.toggl.com/api/v9'
+def deduplicate(seen: set, sequence: Iterator[int], item: SyncItem) -> List[SyncItem]:
+    if item.toggl_id in seen:
+        return []
+    seen.add(item.toggl_id)
+    # numbered once no later stage drops items, the results are logged in this order
+    item.seq = next(sequence)
+    return [item]
 
-    token = config['ToggleApiKey']
-    auth_string = f"{token}:api_token"
-    encoded_auth_string = base64.b64encode(auth_string.encode("ascii")).decode("ascii")
+def sync_recorded(clockify: ClockifyAPI, clockify_settings: ServiceSettings, clockify_id: str, item: SyncItem,
+                  entry: dict) -> Tuple[RetVal, Optional[str]]:
+    # the copy synced earlier is changed in place, so an edit in Toggl does not leave it behind
+    rv, current = clockify.getTimeEntry(clockify_id, clockify_settings.email, clockify_settings.workspace)
+    if rv == RetVal.NOT_FOUND:
+        if item.deleted:
+            return RetVal.OK, None
+        logger.info(f'Entry {clockify_id} synced from Toggl entry {item.toggl_id} is gone from Clockify, adding it again')
+        rv, created = clockify.addEntry(**entry)
+        return rv, created.id if created is not None else None
+    if rv != RetVal.OK:
+        return rv, clockify_id
+    if item.deleted:
+        rv = clockify.deleteEntry(clockify_id, clockify_settings.workspace)
+        return (RetVal.OK if rv == RetVal.NOT_FOUND else rv), None
+    rv, _ = clockify.updateEntry(clockify_id, **entry, current=current)
+    return rv, clockify_id
 
-    headers = {
-        'Authorization': f'Basic {encoded_auth_string}',
-        'Content-Type': 'application/json'
-    }
-    # get time entries
-    params = {
-        'start_date': config['From'],
-        'end_date': config['To']
-    }
+def upload_item(clockify: ClockifyAPI, clockify_settings: ServiceSettings, dry_run: bool,
+                entry_ids: Optional[Dict[int, str]], item: SyncItem) -> List[SyncItem]:
+    if dry_run:
+        logger.info('Dry run - nothing is sent to Clockify.')
+        return []
+    entry = item.entry.addEntryArgs(clockify_settings.email, clockify_settings.workspace)
+    # only a delta run looks the entries up by ID, a full run finds them by the duplicate check
+    clockify_id = entry_ids.get(item.toggl_id) if entry_ids is not None else None
     try:
-        report_response = requests.get(f'{toggle_base_url}/me/time_entries?meta=true', headers=headers, params=params)
-        report_response.raise_for_status()
-        report_data = report_response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f'Error while getting data from Toggl: {str(e)}')
+        if clockify_id is not None:
+            item.result, item.clockify_id = sync_recorded(clockify, clockify_settings, clockify_id, item, entry)
+        elif item.deleted:
+            del entry['billable']
+            item.result, _ = clockify.removeEntry(**entry)
+        else:
+            item.result, created = clockify.addEntry(**entry)
+            if created is not None:
+                item.clockify_id = created.id
+    except (RuntimeError, requests.exceptions.RequestException) as e:
+        logger.error(f'Error while syncing entry "{entry["description"]}" from {clockifyTime(entry["start"])}: {str(e)}')
+        item.result = RetVal.ERR
+    return [item]
+
+def record_entry_id(entry_ids: Dict[int, str], item: SyncItem):
+    if item.result != RetVal.OK and item.result != RetVal.EXISTS:
         return
+    if item.deleted:
+        entry_ids.pop(item.toggl_id, None)
+    elif item.clockify_id is not None:
+        entry_ids[item.toggl_id] = item.clockify_id
 
-    if config.get('DeleteExistingFrom') is True and config.get('DryRun') is False:
-        delete_entries(clockify, clockify_settings, f'{config["From"]} 00:00:00')
+def journal_item(journal: SyncJournal, item: SyncItem) -> List[SyncItem]:
+    journal.record(item.toggl_id, item.result.name)
+    return [item]
 
-    target_workspace_id = int(get_target_workspace_id(toggle_settings.workspace, headers))
-    for row in report_data:
-        if row['stop'] == None: # if task is still running
-            continue
-        if int(row['workspace_id']) != target_workspace_id:
-            continue
-        if row['project_id'] == None:
-            raise Exception(f'task "{row["description"]}" from {row["start"]} has no assigned project (project_id is None)')
-        if config['ToggleFilterClient'] != row['client_name'] and config['ToggleFilterClient'] != '':
+def log_result(item: SyncItem):
+    entry = item.entry
+    action = 'deleted ' if item.deleted else ''
+    logger.info(f'{item.result.name}: {action}{clockifyTime(entry.start)} - {clockifyTime(entry.end)} '
+                f'{entry.project} "{entry.description}"')
+
+def report_results(items: Iterable[SyncItem], results: Dict[RetVal, int],
+                   entry_ids: Optional[Dict[int, str]] = None):
+    # every item is counted as it leaves the pipeline and logged in the original order, only the items
+    # finished ahead of an earlier one are held back, at most as many as are in flight
+    waiting = {}
+    next_seq = 0
+    try:
+        for item in items:
+            results[item.result] = results.get(item.result, 0) + 1
+            if entry_ids is not None:
+                record_entry_id(entry_ids, item)
+            waiting[item.seq] = item
+            while next_seq in waiting:
+                log_result(waiting.pop(next_seq))
+                next_seq += 1
+    finally:
+        for seq in sorted(waiting):
+            log_result(waiting[seq])
+
+def convert_pipeline(rows: Iterable[dict], target_workspace_id: int, job: dict, date_range: Optional[tuple],
+                     entry_ids: Optional[Dict[int, str]] = None) -> SyncPipeline:
+    pipeline = SyncPipeline(rows, maxsize=config.get('PipelineQueueSize', 100))
+    pipeline.add_stage('filter', partial(filter_row, target_workspace_id, job))
+    pipeline.add_stage('convert', partial(convert_row, date_range, entry_ids))
+    pipeline.add_stage('dedupe', partial(deduplicate, set(), itertools.count()))
+    return pipeline
+
+def reconciled_projects(toggl: TogglAPI, clockify: ClockifyAPI, clockify_settings: ServiceSettings,
+                        target_workspace_id: int, job: dict) -> set:
+    """IDs of the Clockify projects the filtered Toggl entries are synced into, a reconcile leaves the
+    entries of any other project (other Toggl workspaces or clients, added by hand) alone."""
+    clients = toggl.getClients(target_workspace_id)
+    projects = set()
+    for project in toggl.getProjects(target_workspace_id).values():
+        client = clients.get(project.get('client_id'))
+        client_name = client['name'] if client is not None else ''
+        if job['ToggleFilterClient'] != '' and client_name != job['ToggleFilterClient']:
             continue
-        if config['ToggleFilterUser'] != row['user_name'] and config['ToggleFilterUser'] != '':
+        try:
+            projects.add(clockify.getProjectID(project['name'], clockify_settings.workspace))
+        except RuntimeError:
+            # not in Clockify, so no entry of it to compare
             continue
-        
-        start = datetime.datetime.strptime(row["start"], "%Y-%m-%dT%H:%M:%S%z").strftime(CSV_DATE_TIME_FORMAT)
-        start = datetime.datetime.strptime(start, CSV_DATE_TIME_FORMAT)
-        end = datetime.datetime.strptime(row["stop"], "%Y-%m-%dT%H:%M:%S%z").strftime(CSV_DATE_TIME_FORMAT)
-        end = datetime.datetime.strptime(end, CSV_DATE_TIME_FORMAT)
-
-        tags = [tag.strip() for tag in row['tags'] if tag.strip() != '']
-
-        # tag billable if there's a tag billable
-        billable = 'billable' in tags
-        # remove billable and non-billable tags as we don't need them anymore
-        tags = [tag for tag in tags if tag not in {'non-billable', 'billable'}]
-
-        if config.get('DryRun') is False:
-            clockify.addEntry(
-                start=start,
-                description=row['description'],
-                projectName= row['project_name'],
-                userMail=clockify_settings.email,
-                workspace=clockify_settings.workspace,
-                end=end,
-                billable=billable
-            )
+    return projects
+
+def reconcile_range(clockify: ClockifyAPI, toggl: TogglAPI, clockify_settings: ServiceSettings, rows: Iterable[dict],
+                    target_workspace_id: int, job: dict, date_range: tuple, dry_run: bool, workers: int, run: dict):
+    pipeline = convert_pipeline(rows, target_workspace_id, job, date_range)
+    try:
+        # the plan needs every entry of the range, only their TimeEntry is kept
+        desired = [item.entry for item in pipeline.run() if not item.deleted]
+        projects = reconciled_projects(toggl, clockify, clockify_settings, target_workspace_id, job)
+    except requests.exceptions.RequestException as e:
+        logger.error(f'Error while getting data from Toggl: {str(e)}')
+        return
+    finally:
+        pipeline.log_stats()
+
+    clockify.prefetchTimeEntries(clockify_settings.email, clockify_settings.workspace, date_range[0], date_range[1])
+    # running timers are left alone, Toggl does not export them either
+    existing = [entry for entry in clockify.prefetchedTimeEntries(clockify_settings.email)
+                if entry.end is not None and entry.project in projects]
+    plan = plan_reconcile(
+        desired,
+        existing,
+        lambda project_name: clockify.getProjectID(project_name, clockify_settings.workspace)
+    )
+    logger.info(f'Reconcile plan for {len(desired)} Toggl and {len(existing)} Clockify entries: {plan.counts()}')
+    run['entries'] = plan.counts()
+    if dry_run:
+        logger.info('Dry run - nothing is sent to Clockify.')
+        run['success'] = 0 if plan.failed else 1
+        return
+
+    failed = apply_plan(clockify, plan, clockify_settings.email, clockify_settings.workspace,
+                        batch_size=config.get('ReconcileBatchSize', 50), workers=max(1, workers))
+    run['failed'] = failed
+    if any(failed.values()):
+        logger.warning(f'Some writes of the reconcile plan failed: {failed}')
+    else:
+        logger.info('Reconcile plan applied')
+        run['success'] = 1
+
+def export_metrics(run: dict):
+    metrics = getMetrics()
+    summary = metrics.summary()
+    sleeps = sum(service['seconds'] for service in summary['rateLimitSleep'].values())
+    logger.info(f'Sync took {run["duration_seconds"]:.2f}s, {summary["requests"]} requests, '
+                f'{sleeps:.2f}s waiting for the rate limits')
+    if config.get('MetricsFile', 'sync_metrics.json'):
+        metrics.writeJson(config.get('MetricsFile', 'sync_metrics.json'), run)
+    if config.get('PrometheusFile'):
+        metrics.writePrometheus(config['PrometheusFile'], run)
+
+def main(workers: int = 1, resume: bool = False):
+    if not config:
+        load_config()
+
+    getMetrics().reset()
+    run = {'last_run_timestamp_seconds': int(time.time()), 'success': 0}
+    started = time.perf_counter()
+    try:
+        sync(workers, run, resume)
+    finally:
+        run['duration_seconds'] = round(time.perf_counter() - started, 3)
+        export_metrics(run)
+
+def batch_jobs() -> List[dict]:
+    """The configuration of every user to sync. A `Users` list in the config describes a batch, each item
+    overrides the top level keys for one user; without it the config describes a single user."""
+    users = config.get('Users')
+    if not users:
+        return [config]
+    root, ext = os.path.splitext(config.get('JournalFile', 'sync_journal.jsonl'))
+    jobs = []
+    for user in users:
+        job = {key: value for key, value in config.items() if key != 'Users'}
+        job.update(user)
+        if 'JournalFile' not in user:
+            # an interrupted batch resumes every user from its own journal
+            job['JournalFile'] = f'{root}.{job["ClockifyAdminEmail"]}{ext}'
+        jobs.append(job)
+    return jobs
+
+def sync(workers: int, run: dict, resume: bool = False):
+    jobs = batch_jobs()
+
+    cache = None
+    if config.get('CacheTTL', 3600) > 0:
+        cache = MetadataCache(config.get('CacheFile', 'clockify_cache.json'), config.get('CacheTTL', 3600))
+
+    # ClockifyAPI keeps the metadata (projects, tags, users) of one workspace, fetched once and shared by the users
+    if len({job['ClockifyWorkspace'] for job in jobs}) > 1:
+        raise RuntimeError('All users of a batch have to sync into the same ClockifyWorkspace')
+    tokens = list(dict.fromkeys([config['ClockifyApiKey']] + [job['ClockifyApiKey'] for job in jobs]))
+    clockify = ClockifyAPI(
+        tokens,
+        config['ClockifyAdminEmail'],
+        reqTimeout=None,
+        rateLimit=config.get('ClockifyRateLimit', CLOCKIFY_RATE_LIMIT),
+        cache=cache,
+        url=config.get('ClockifyUrl', 'https://api.clockify.me/api/v1')
+    )
+
+    try:
+        if 'Users' not in config:
+            sync_user(clockify, cache, config, workers, run, resume)
+            return
+
+        user_runs = {job['ClockifyAdminEmail']: {'success': 0} for job in jobs}
+
+        def sync_job(job: dict):
+            try:
+                sync_user(clockify, cache, job, workers, user_runs[job['ClockifyAdminEmail']], resume)
+            except Exception as e:
+                logger.error(f'Sync of {job["ClockifyAdminEmail"]} failed: {str(e)}')
+
+        with ThreadPoolExecutor(max_workers=max(1, config.get('BatchWorkers', 4))) as pool:
+            list(pool.map(sync_job, jobs))
+
+        run['users'] = user_runs
+        run['entries'] = {}
+        for user_run in user_runs.values():
+            for name, count in user_run.get('entries', {}).items():
+                run['entries'][name] = run['entries'].get(name, 0) + count
+        run['success'] = 1 if all(user_run['success'] for user_run in user_runs.values()) else 0
+        logger.info(f'Synced {len(jobs)} users: {run["entries"]}, '
+                    f'{sum(1 for user_run in user_runs.values() if not user_run["success"])} failed')
+    finally:
+        clockify.close()
+
+def sync_user(clockify: ClockifyAPI, cache: Optional[MetadataCache], job: dict, workers: int, run: dict,
+              resume: bool = False):
+    clockify_settings = ServiceSettings(
+        job['ClockifyApiKey'],
+        job['ClockifyWorkspace'],
+        job['ClockifyAdminEmail']
+    )
+
+    toggle_settings = ServiceSettings(
+        job['ToggleApiKey'],
+        job['ToggleWorkspace']
+    )
+
+    toggl = TogglAPI(
+        toggle_settings.token,
+        rateLimit=job.get('ToggleRateLimit', TOGGL_RATE_LIMIT),
+        cache=cache,
+        url=job.get('ToggleUrl', 'https://api.track.toggl.com/api/v9')
+    )
+
+    try:
+        # get time entries, in incremental mode only the ones changed since the last run
+        watermark_key = f'{toggle_settings.workspace}/{clockify_settings.workspace}/{clockify_settings.email}'
+        state_file = job.get('StateFile', 'sync_state.json')
+        reconcile = job.get('Reconcile') is True
+        # reconciling needs the whole range to know which Clockify entries are gone from Toggl
+        incremental = job.get('Incremental') is True and not reconcile
+        watermark, entry_ids = load_state(state_file, watermark_key) if incremental else (None, None)
+        if watermark is not None and \
+                datetime.datetime.now().timestamp() - watermark > TOGGL_SINCE_MAX_AGE.total_seconds():
+            logger.info('Last incremental run is too old, fetching the whole range')
+            watermark = None
+        if incremental and entry_ids is None:
+            # without the Clockify IDs an edited Toggl entry could not replace the copy synced before
+            if watermark is not None:
+                logger.info('No Clockify IDs of the synced entries recorded yet, fetching the whole range')
+            watermark = None
+            entry_ids = {}
+
+        try:
+            target_workspace_id = toggl.getWorkspaceID(toggle_settings.workspace)
+        except requests.exceptions.RequestException as e:
+            logger.error(f'Error while getting data from Toggl: {str(e)}')
+            return
+
+        dry_run = job.get('DryRun') is not False
+        date_range = None
+        if watermark is not None or reconcile:
+            # the changes are not limited to the range by Toggl, a reconcile compares exactly this range
+            date_range = (togglEpoch(f'{job["From"]}T00:00:00Z'), togglEpoch(f'{shift_date(job["To"], 1)}T00:00:00Z'))
+        # To is included, Toggl takes the end date as exclusive
+        fetch_from, fetch_to = job['From'], shift_date(job['To'], 1)
+        if reconcile:
+            # Toggl interprets the dates in the user's timezone, a day of margin on both sides covers the UTC
+            # range compared with Clockify whatever the timezone, the entries outside of it are dropped
+            fetch_from, fetch_to = shift_date(job['From'], -1), shift_date(job['To'], 2)
+        if watermark is not None:
+            logger.info(f'Fetching Toggl entries changed since {datetime.datetime.fromtimestamp(watermark)}')
+            rows = toggl.iterTimeEntries(since=watermark)
         else:
-            logger.info('Dry run - nothing is sent to Clockify.')
+            rows = toggl.iterTimeEntriesSharded(
+                fetch_from,
+                fetch_to,
+                window=job.get('ToggleWindow', 'month'),
+                workers=job.get('ToggleWorkers', 4)
+            )
+
+        if reconcile:
+            reconcile_range(clockify, toggl, clockify_settings, rows, target_workspace_id, job, date_range, dry_run,
+                            workers, run)
+            return
+
+        journal = None
+        done = {}
+        if not dry_run:
+            journal = SyncJournal(
+                job.get('JournalFile', 'sync_journal.jsonl'),
+                journal_job(toggle_settings.workspace, clockify_settings.workspace, clockify_settings.email,
+                            job['From'], job['To'], watermark),
+                batch=job.get('JournalBatchSize', 50)
+            )
+            if resume:
+                done = journal.load()
+                logger.info(f'Resuming, {len(done)} entries were already processed by the interrupted run')
+            journal.open(resume)
+
+        if job.get('DeleteExistingFrom') is True and not dry_run:
+            if watermark is not None:
+                # only the changes are uploaded again, the entries already synced have to stay
+                logger.info('Incremental run, the existing entries are updated instead of deleted by '
+                            'DeleteExistingFrom')
+            elif done:
+                logger.info('The interrupted run already deleted the existing entries')
+            else:
+                delete_entries(clockify, clockify_settings, f'{job["From"]} 00:00:00', f'{job["To"]} 23:59:59')
+
+        watermark_state = {'watermark': watermark}
+        journal_state = {'skipped': 0}
+        rows = skip_journaled(track_watermark(rows, watermark_state), done, journal_state)
+        delta_ids = entry_ids if watermark is not None else None
+        pipeline = convert_pipeline(rows, target_workspace_id, job, date_range, delta_ids)
+        # a delta is checked entry by entry, prefetching the whole range only pays off for full runs
+        if watermark is None and not dry_run:
+            prefetch = partial(prefetch_entries, clockify, clockify_settings, job['From'], job['To'])
+            pipeline.add_stage('prefetch', partial(prefetch_once, prefetch, {'done': False}))
+        # ClockifyAPI keeps the loaded user and the HTTP sessions per thread, so the workers can share it
+        pipeline.add_stage('upload', partial(upload_item, clockify, clockify_settings, dry_run, delta_ids),
+                           workers=max(1, workers))
+        if journal is not None:
+            pipeline.add_stage('journal', partial(journal_item, journal))
+
+        failed = True
+        results = {}
+        recorded = entry_ids if incremental and not dry_run else None
+        try:
+            report_results(pipeline.run(), results, recorded)
+            failed = any(rv != RetVal.OK and rv != RetVal.EXISTS for rv in results)
+        except requests.exceptions.RequestException as e:
+            logger.error(f'Error while getting data from Toggl: {str(e)}')
+            return
+        finally:
+            pipeline.log_stats()
+            if journal is not None:
+                journal.close(completed=not failed)
+            if recorded is not None:
+                # the IDs of what did get synced are kept even if the run fails
+                save_state(state_file, watermark_key, entry_ids=recorded)
+        if journal_state['skipped']:
+            logger.info(f'Skipped {journal_state["skipped"]} entries synced by the interrupted run')
+            run['skipped'] = journal_state['skipped']
+        run['entries'] = {rv.name: results[rv] for rv in RetVal if rv in results}
+        logger.info(f'Synced {sum(results.values())} entries: {run["entries"]}')
+        run['success'] = 0 if failed else 1
+
+        new_watermark = watermark_state['watermark']
+        if incremental and new_watermark is not None and not dry_run:
+            if failed:
+                logger.warning('Some entries failed, the next incremental run will retry them')
+            else:
+                save_state(state_file, watermark_key, watermark=new_watermark)
+    finally:
+        toggl.close()
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Exports time entries from Toggl to Clockify.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of threads uploading entries to Clockify in parallel (default: 1)')
+    parser.add_argument('--config', default='config.json', help='path of the configuration (default: config.json)')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the entries an interrupted run already synced, as recorded in its journal')
+    parser.add_argument('--profile', nargs='?', const='profile_report.txt', metavar='REPORT',
+                        help='run under cProfile and tracemalloc and write a report (default: profile_report.txt)')
+    args = parser.parse_args()
+    load_config(args.config)
+    if args.profile:
+        run_profiled(partial(main, workers=args.workers, resume=args.resume), args.profile)
+    else:
+        main(workers=args.workers, resume=args.resume)
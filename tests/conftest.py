@@ -0,0 +1,91 @@
+import datetime
+import json
+import logging
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from standin import StandIn  # noqa: E402
+
+CLOCKIFY_TOKEN = 'clockify-token'
+TOGGL_TOKEN = 'toggl-token'
+ADMIN_EMAIL = 'admin@example.com'
+PROJECT = 'Project'
+
+
+def day(number: int, hour: int = 9, tz: datetime.tzinfo = datetime.timezone.utc) -> datetime.datetime:
+    return datetime.datetime(2021, 1, number, hour, tzinfo=tz)
+
+
+def touch(entry: dict, **changes):
+    """Changes a Toggl entry the way an edit in Toggl does, including its `at` timestamp."""
+    entry.update(changes)
+    entry['at'] = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()
+
+
+def descriptions(standin: StandIn) -> list:
+    return sorted(entry['description'] for entry in standin.entries)
+
+
+@pytest.fixture
+def standin():
+    with StandIn() as standin:
+        standin.add_clockify_user(CLOCKIFY_TOKEN, ADMIN_EMAIL)
+        standin.add_toggl_token(TOGGL_TOKEN)
+        standin.add_project(PROJECT)
+        yield standin
+
+
+@pytest.fixture
+def clockify(standin):
+    from ClockifyAPI import ClockifyAPI
+    api = ClockifyAPI(CLOCKIFY_TOKEN, ADMIN_EMAIL, reqTimeout=None, url=standin.clockify_url)
+    yield api
+    api.close()
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """main.py imported in a temporary directory, where it writes its log and state files."""
+    monkeypatch.chdir(tmp_path)
+    import main
+    logging.getLogger('clockify-automation').setLevel(logging.WARNING)
+    return main
+
+
+@pytest.fixture
+def sync(standin, main, tmp_path):
+    """Runs main.main against the stand-in in a temporary directory, the keyword arguments override the config."""
+
+    def run(workers: int = 1, resume: bool = False, **settings):
+        config = {
+            'ClockifyApiKey': CLOCKIFY_TOKEN,
+            'ClockifyAdminEmail': ADMIN_EMAIL,
+            'ClockifyWorkspace': standin.clockify_workspace,
+            'ClockifyUrl': standin.clockify_url,
+            'ToggleApiKey': TOGGL_TOKEN,
+            'ToggleWorkspace': standin.toggl_workspace,
+            'ToggleUrl': standin.toggl_url,
+            'ToggleFilterClient': '',
+            'ToggleFilterUser': '',
+            'From': '2021-01-01',
+            'To': '2021-01-31',
+            'DeleteExistingFrom': False,
+            'DryRun': False,
+            'ToggleRateLimit': 100,
+            'CacheTTL': 0,
+        }
+        config.update(settings)
+        with open(tmp_path / 'config.json', 'w') as f:
+            json.dump(config, f)
+        main.load_config(str(tmp_path / 'config.json'))
+        main.main(workers=workers, resume=resume)
+        with open(tmp_path / 'sync_metrics.json') as f:
+            return json.load(f)['run']
+
+    return run
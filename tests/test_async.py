@@ -0,0 +1,23 @@
+import asyncio
+
+from conftest import ADMIN_EMAIL, CLOCKIFY_TOKEN, PROJECT, day
+from AsyncClockifyAPI import AsyncClockifyAPI
+from ClockifyAPI import RetVal
+
+
+def test_add_entry_with_task(standin):
+    project = standin.projects[0]
+    standin.tasks.append({'id': 'k1', 'name': 'Review', 'projectId': project['id']})
+
+    async def add():
+        async with AsyncClockifyAPI(CLOCKIFY_TOKEN, ADMIN_EMAIL, url=standin.clockify_url) as clockify:
+            return await asyncio.gather(*[
+                clockify.addEntry(day(number), f'day {number}', PROJECT, ADMIN_EMAIL, standin.clockify_workspace,
+                                  end=day(number, 10), taskName='Review')
+                for number in (1, 2)])
+
+    results = asyncio.run(add())
+
+    assert [rv for rv, _ in results] == [RetVal.OK, RetVal.OK]
+    assert [entry['taskId'] for entry in standin.entries] == ['k1', 'k1']
+    assert standin.endpoint_counts()['GET clockify/workspaces/{ws}/projects/{project}/tasks'] == 1
@@ -0,0 +1,17 @@
+from conftest import ADMIN_EMAIL, CLOCKIFY_TOKEN, PROJECT, day
+
+
+def test_bad_token_only_fails_its_user(standin, sync):
+    admin = standin.users[CLOCKIFY_TOKEN]
+    for number in range(1, 4):
+        standin.add_toggl_entry(day(number), day(number, 10), f'day {number}', PROJECT)
+
+    run = sync(Users=[
+        {'ClockifyApiKey': CLOCKIFY_TOKEN, 'ClockifyAdminEmail': ADMIN_EMAIL},
+        {'ClockifyApiKey': 'bad-token', 'ClockifyAdminEmail': 'other@example.com'},
+    ])
+
+    assert run['users'][ADMIN_EMAIL]['success'] == 1
+    assert run['users']['other@example.com']['success'] == 0
+    assert run['success'] == 0
+    assert [entry['userId'] for entry in standin.entries] == [admin['id']] * 3
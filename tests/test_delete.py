@@ -0,0 +1,20 @@
+from conftest import ADMIN_EMAIL, PROJECT, day
+from ClockifyAPI import RetVal
+
+
+def test_entries_the_bulk_delete_skips_are_reported(standin, clockify):
+    entries = []
+    for number in range(1, 4):
+        rv, entry = clockify.addEntry(day(number), f'day {number}', PROJECT, ADMIN_EMAIL,
+                                      standin.clockify_workspace, end=day(number, 10))
+        assert rv == RetVal.OK
+        entries.append(entry)
+    # removed behind our back, the bulk delete skips it without an error
+    standin.entries = [e for e in standin.entries if e['id'] != entries[1].id]
+
+    deleted, failed = clockify.deleteEntriesById(ADMIN_EMAIL, standin.clockify_workspace,
+                                                 [entry.id for entry in entries] + ['unknown'])
+
+    assert deleted == 2
+    assert failed == [entries[1].id, 'unknown']
+    assert standin.entries == []
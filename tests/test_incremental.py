@@ -0,0 +1,83 @@
+import datetime
+
+from conftest import PROJECT, day, descriptions, touch
+
+
+def add_days(standin, days=10):
+    entries = []
+    for number in range(1, days + 1):
+        entries.append(standin.add_toggl_entry(day(number), day(number, 10), f'day {number}', PROJECT))
+        touch(entries[-1])
+    return entries
+
+
+def test_edited_entry_updates_its_copy(standin, sync):
+    entries = add_days(standin)
+    assert sync(Incremental=True)['success'] == 1
+    synced = {entry['description']: entry['id'] for entry in standin.entries}
+
+    touch(entries[1], description='day 2 edited', stop=day(2, 11).isoformat())
+    assert sync(Incremental=True)['success'] == 1
+
+    assert len(standin.entries) == 10
+    assert 'day 2' not in descriptions(standin)
+    edited = next(entry for entry in standin.entries if entry['description'] == 'day 2 edited')
+    assert edited['id'] == synced['day 2']
+    assert edited['timeInterval']['end'] == '2021-01-02T11:00:00Z'
+
+
+def test_edit_keeps_task_and_tags_set_in_clockify(standin, sync):
+    entries = add_days(standin, 2)
+    sync(Incremental=True)
+    tag = standin.add_tag('reviewed')
+    copy = next(entry for entry in standin.entries if entry['description'] == 'day 1')
+    copy.update(taskId='k1', tagIds=[tag['id']])
+
+    touch(entries[0], description='day 1 edited')
+    sync(Incremental=True)
+
+    copy = next(entry for entry in standin.entries if entry['description'] == 'day 1 edited')
+    assert copy['taskId'] == 'k1'
+    assert copy['tagIds'] == [tag['id']]
+
+
+def test_deleted_entry_removes_its_copy(standin, sync):
+    entries = add_days(standin)
+    sync(Incremental=True)
+
+    touch(entries[2], server_deleted_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+    touch(entries[3], start=day(1, 12).replace(year=2020).isoformat(),
+          stop=day(1, 13).replace(year=2020).isoformat())
+    assert sync(Incremental=True)['success'] == 1
+
+    assert descriptions(standin) == sorted(f'day {number}' for number in (1, 2, 5, 6, 7, 8, 9, 10))
+
+
+def test_delete_existing_from_does_not_wipe_delta_runs(standin, sync):
+    entries = add_days(standin)
+    sync(Incremental=True, DeleteExistingFrom=True)
+    assert len(standin.entries) == 10
+
+    touch(entries[1], description='day 2 edited')
+    assert sync(Incremental=True, DeleteExistingFrom=True)['success'] == 1
+
+    assert len(standin.entries) == 10
+    assert 'day 2 edited' in descriptions(standin)
+    assert 'day 2' not in descriptions(standin)
+
+
+def test_state_without_ids_falls_back_to_whole_range(standin, sync, tmp_path):
+    entries = add_days(standin, 3)
+    sync()
+    # a watermark written by an older version, without the Clockify IDs
+    watermark = int(datetime.datetime.now().timestamp()) - 60
+    key = f'{standin.toggl_workspace}/{standin.clockify_workspace}/admin@example.com'
+    (tmp_path / 'sync_state.json').write_text(f'{{"{key}": {watermark}}}')
+
+    touch(entries[0], description='day 1 edited')
+    sync(Incremental=True)
+    touch(entries[0], description='day 1 edited again')
+    sync(Incremental=True)
+
+    # the first run fetched the whole range and recorded the IDs, the edit before it is added next to 'day 1'
+    assert descriptions(standin) == ['day 1', 'day 1 edited again', 'day 2', 'day 3']
@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import ADMIN_EMAIL, CLOCKIFY_TOKEN
+from standin import WORKSPACE_ID
+from ClockifyAPI import ClockifyAPI
+
+ENDPOINT = 'GET clockify/workspaces/{ws}/tags'
+
+
+@pytest.fixture
+def tags(standin):
+    return [standin.add_tag(f'tag {number}')['id'] for number in range(1, 451)]
+
+
+def get_tags(standin, **settings):
+    clockify = ClockifyAPI(CLOCKIFY_TOKEN, ADMIN_EMAIL, reqTimeout=None, url=standin.clockify_url, **settings)
+    try:
+        url = f'{standin.clockify_url}/workspaces/{WORKSPACE_ID}/tags'
+        return [tag['id'] for tag in clockify.multiGetIter(url)]
+    finally:
+        clockify.close()
+
+
+def test_pages_are_fetched_in_parallel(standin, tags):
+    assert get_tags(standin, pageSize=100, pageWorkers=4) == tags
+    # after the first page four are kept in flight, pages 6 to 8 were already asked for when the short fifth came
+    assert standin.endpoint_counts()[ENDPOINT] == 8
+
+
+def test_repeated_page_stops_paging(standin, tags):
+    standin.repeat_last_page = True
+
+    assert get_tags(standin, pageSize=50, pageWorkers=2) == tags
+    # page 10 repeats page 9 and ends it, page 11 was already in flight
+    assert standin.endpoint_counts()[ENDPOINT] == 11
+
+
+def test_refused_page_size_is_halved(standin, tags):
+    standin.max_page_size = 100
+
+    assert get_tags(standin, pageSize=400, pageWorkers=1) == tags
+    # 400 and 200 refused, then five pages of 100
+    assert standin.endpoint_counts()[ENDPOINT] == 2 + 5
@@ -0,0 +1,25 @@
+import threading
+
+import Profiling
+
+
+def test_worker_threads_are_profiled_once(monkeypatch):
+    calls = []
+    start_thread = Profiling._ThreadProfiles._start_thread
+    monkeypatch.setattr(Profiling._ThreadProfiles, '_start_thread',
+                        lambda self, *args: calls.append(args) or start_thread(self, *args))
+
+    def work():
+        for number in range(20000):
+            abs(number)
+
+    profiles = Profiling._ThreadProfiles()
+    profiles.start()
+    worker = threading.Thread(target=work)
+    worker.start()
+    worker.join()
+    stats = profiles.stop()
+
+    # the hook only starts the profiler of the thread, it does not run for every call
+    assert len(calls) <= 1
+    assert any(function == 'work' for _, _, function in stats.stats)
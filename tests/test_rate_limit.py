@@ -0,0 +1,46 @@
+import time
+
+from conftest import ADMIN_EMAIL, PROJECT, day
+from standin import StandIn
+from ClockifyAPI import ClockifyAPI, RetVal
+from RateLimiter import RateLimiter, retryAfterSeconds
+
+
+def test_rate_limited_requests_are_retried():
+    # a token of its own, the limiters are shared by the whole process
+    token = 'rate-limited-token'
+    with StandIn(rate_limit=5, retry_after=0.2) as standin:
+        standin.add_clockify_user(token, ADMIN_EMAIL)
+        standin.add_project(PROJECT)
+        clockify = ClockifyAPI(token, ADMIN_EMAIL, reqTimeout=None, rateLimit=50, url=standin.clockify_url)
+        try:
+            results = [clockify.addEntry(day(number), f'day {number}', PROJECT, ADMIN_EMAIL,
+                                         standin.clockify_workspace, end=day(number, 10))[0]
+                       for number in range(1, 13)]
+            limiter = clockify._getRateLimiter()
+        finally:
+            clockify.close()
+
+    assert results == [RetVal.OK] * 12
+    assert len(standin.entries) == 12
+    assert sum(standin.throttled.values()) > 0
+    # slowed down below the configured rate, climbing back up with the successful requests
+    assert limiter.rate < 50
+
+
+def test_retry_after_blocks_every_caller():
+    limiter = RateLimiter(100)
+
+    assert limiter.backoff(0.3) == 0.3
+    assert limiter.rate == 50
+    assert 0.2 < limiter.reserve() <= 0.3
+    assert 0.2 < limiter.reserve() <= 0.3
+    time.sleep(0.3)
+    assert limiter.reserve() == 0
+
+
+def test_retry_after_header():
+    assert retryAfterSeconds({'Retry-After': '2'}) == 2.0
+    assert retryAfterSeconds({'Retry-After': 'Thu, 01 Jan 2015 00:00:00 GMT'}) == 0.0
+    assert retryAfterSeconds({'Retry-After': 'soon'}) is None
+    assert retryAfterSeconds({}) is None
@@ -0,0 +1,83 @@
+import datetime
+
+from conftest import PROJECT, day, descriptions, touch
+
+CET = datetime.timezone(datetime.timedelta(hours=2))
+
+
+def test_last_day_of_the_range_is_kept(standin, sync):
+    for number in range(1, 6):
+        standin.add_toggl_entry(day(number), day(number, 10), f'day {number}', PROJECT)
+    sync(To='2021-01-05')
+    assert len(standin.entries) == 5
+
+    run = sync(To='2021-01-05', Reconcile=True)
+
+    assert run['success'] == 1
+    assert run['entries'] == {'create': 0, 'update': 0, 'delete': 0, 'unchanged': 5, 'failed': 0}
+    assert 'day 5' in descriptions(standin)
+
+
+def test_entries_near_the_edges_in_other_timezones(standin, sync):
+    # 2021-01-02 00:30 and 2021-01-05 01:00 local time are 2021-01-01 22:30 and 2021-01-04 23:00 in UTC
+    for start in (day(2, 0, CET), day(3, 12, CET), day(4, 23, CET), day(5, 1, CET)):
+        standin.add_toggl_entry(start, start + datetime.timedelta(minutes=30), f'at {start.isoformat()}', PROJECT)
+    settings = {'From': '2021-01-02', 'To': '2021-01-04', 'Reconcile': True}
+
+    first = sync(**settings)
+    second = sync(**settings)
+
+    assert first['entries'] == {'create': 3, 'update': 0, 'delete': 0, 'unchanged': 0, 'failed': 0}
+    assert second['entries'] == {'create': 0, 'update': 0, 'delete': 0, 'unchanged': 3, 'failed': 0}
+    assert descriptions(standin) == sorted(f'at {start.isoformat()}'
+                                           for start in (day(3, 12, CET), day(4, 23, CET), day(5, 1, CET)))
+
+
+def test_update_keeps_task_and_tags(standin, sync):
+    entry = standin.add_toggl_entry(day(1), day(1, 10), 'day 1', PROJECT)
+    sync(Reconcile=True)
+    tag = standin.add_tag('reviewed')
+    standin.entries[0].update(taskId='k1', tagIds=[tag['id']])
+    entry_id = standin.entries[0]['id']
+
+    touch(entry, description='day 1 edited')
+    run = sync(Reconcile=True)
+
+    assert run['entries']['update'] == 1
+    [copy] = standin.entries
+    assert (copy['id'], copy['description'], copy['taskId'], copy['tagIds']) == \
+        (entry_id, 'day 1 edited', 'k1', [tag['id']])
+
+
+def test_missing_project_fails_without_deleting(standin, sync):
+    standin.add_toggl_entry(day(1), day(1, 10), 'day 1', PROJECT)
+    sync(Reconcile=True)
+    standin.add_toggl_entry(day(2), day(2, 10), 'day 2', 'Unknown project')
+    # the copy of 'day 1' is left over while the new entry fails to plan
+    standin.toggl_entries[0]['server_deleted_at'] = day(3).isoformat()
+
+    run = sync(Reconcile=True)
+
+    assert run['success'] == 0
+    assert run['entries']['failed'] == 1
+    assert run['failed']['plan'] == 1
+    assert descriptions(standin) == ['day 1']
+
+
+def test_entries_outside_the_filter_are_left_alone(standin, sync):
+    standin.add_project('Other project')
+    standin.add_project('Gone project')
+    standin.add_toggl_entry(day(1), day(1, 10), 'client A', PROJECT, client_name='A')
+    standin.add_toggl_entry(day(2), day(2, 10), 'client B', 'Other project', client_name='B')
+    gone = standin.add_toggl_entry(day(3), day(3, 10), 'client A, deleted', 'Gone project', client_name='A')
+    sync()
+    assert len(standin.entries) == 3
+    # by hand in Clockify, in a project Toggl does not know
+    standin.entries.append(dict(standin.entries[0], id='manual', description='by hand',
+                                projectId=standin.add_project('Clockify only')['id']))
+    gone['server_deleted_at'] = day(4).isoformat()
+
+    run = sync(Reconcile=True, ToggleFilterClient='A')
+
+    assert run['entries'] == {'create': 0, 'update': 0, 'delete': 1, 'unchanged': 1, 'failed': 0}
+    assert descriptions(standin) == ['by hand', 'client A', 'client B']
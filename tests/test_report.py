@@ -0,0 +1,21 @@
+import logging
+
+from conftest import day
+
+from ClockifyAPI import RetVal
+from TimeEntry import TimeEntry
+
+
+def test_results_are_logged_in_the_original_order(main, caplog):
+    items = [main.SyncItem(seq, TimeEntry(seq, day(seq + 1), day(seq + 1, 10), f'day {seq + 1}'), result=RetVal.OK,
+                           seq=seq) for seq in range(5)]
+    # as they finish in the upload workers
+    finished = [items[idx] for idx in (1, 0, 3, 4, 2)]
+    caplog.set_level(logging.INFO, logger='clockify-automation')
+    results = {}
+
+    main.report_results(iter(finished), results)
+
+    logged = [record.getMessage().rsplit('"', 2)[1] for record in caplog.records]
+    assert logged == [f'day {number}' for number in range(1, 6)]
+    assert results == {RetVal.OK: 5}
@@ -0,0 +1,54 @@
+from conftest import PROJECT, day, descriptions
+
+ADD_ENTRY = 'POST clockify/workspaces/{ws}/time-entries'
+
+
+def add_days(standin, days=10):
+    for number in range(1, days + 1):
+        standin.add_toggl_entry(day(number), day(number, 10), f'day {number}', PROJECT)
+
+
+def test_resume_skips_the_synced_entries(standin, sync):
+    add_days(standin)
+    standin.fail_after(ADD_ENTRY, 6)
+    assert sync()['success'] == 0
+    assert len(standin.entries) == 6
+
+    standin.failing.clear()
+    standin.requests.clear()
+    run = sync(resume=True)
+
+    assert run['success'] == 1
+    assert run['skipped'] == 6
+    assert standin.requests[ADD_ENTRY] == 4
+    assert descriptions(standin) == sorted(f'day {number}' for number in range(1, 11))
+
+
+def test_resume_after_losing_the_last_journal_batch(standin, sync, tmp_path):
+    add_days(standin)
+    standin.fail_after(ADD_ENTRY, 6)
+    sync(JournalBatchSize=2)
+    # a crash loses the buffered lines, those entries are in Clockify but not in the journal
+    journal = tmp_path / 'sync_journal.jsonl'
+    journal.write_text(''.join(journal.read_text().splitlines(keepends=True)[:4]))
+
+    standin.failing.clear()
+    run = sync(resume=True, JournalBatchSize=2)
+
+    assert run['success'] == 1
+    assert run['skipped'] == 3
+    assert run['entries'] == {'OK': 4, 'EXISTS': 3}
+    assert descriptions(standin) == sorted(f'day {number}' for number in range(1, 11))
+
+
+def test_resume_does_not_delete_the_range_again(standin, sync):
+    add_days(standin)
+    standin.fail_after(ADD_ENTRY, 6)
+    sync(DeleteExistingFrom=True)
+    synced = {entry['id'] for entry in standin.entries}
+
+    standin.failing.clear()
+    assert sync(resume=True, DeleteExistingFrom=True)['success'] == 1
+
+    assert synced <= {entry['id'] for entry in standin.entries}
+    assert len(standin.entries) == 10